@@ -0,0 +1,47 @@
+"""Сравнение пакетного расчета с расчетом по объектам."""
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+
+SIZE = 100_000
+
+
+def make_columns(workout_type, size, rnd):
+    columns = {
+        'action': [rnd.randint(100, 20000) for _ in range(size)],
+        'duration': [rnd.uniform(0.2, 3) for _ in range(size)],
+        'weight': [rnd.randint(40, 120) for _ in range(size)],
+    }
+    if workout_type == 'WLK':
+        columns['height'] = [rnd.randint(140, 210) for _ in range(size)]
+    if workout_type == 'SWM':
+        columns['length_pool'] = [rnd.choice((25, 50)) for _ in range(size)]
+        columns['count_pool'] = [rnd.randint(1, 80) for _ in range(size)]
+    return columns
+
+
+def object_loop(workout_type, columns):
+    for data in zip(*columns.values()):
+        homework.read_package(workout_type, list(data)).show_training_info()
+
+
+def main():
+    rnd = random.Random(0)
+    for workout_type in ('SWM', 'RUN', 'WLK'):
+        columns = make_columns(workout_type, SIZE, rnd)
+        objects = min(timeit.repeat(
+            lambda: object_loop(workout_type, columns), number=1, repeat=3))
+        batch = min(timeit.repeat(
+            lambda: homework.calculate_batch(workout_type, columns),
+            number=1, repeat=3))
+        print(f'{workout_type}: objects {SIZE / objects:,.0f} pkg/s, '
+              f'batch {SIZE / batch:,.0f} pkg/s, x{objects / batch:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Сравнение чтения пакетов из CSV, JSON и бинарного формата."""
+import io
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+
+SIZE = 200_000
+
+
+def make_packages(size, rnd):
+    packages = []
+    for _ in range(size):
+        code = rnd.choice(('SWM', 'RUN', 'WLK'))
+        data = [rnd.randint(100, 20000), rnd.randint(1, 3),
+                rnd.randint(40, 120)]
+        if code == 'WLK':
+            data.append(rnd.randint(140, 210))
+        if code == 'SWM':
+            data += [rnd.choice((25, 50)), rnd.randint(1, 80)]
+        packages.append((code, data))
+    return packages
+
+
+def consume(packages):
+    for workout_type, data in packages:
+        homework.read_package(workout_type, data).show_training_info()
+
+
+def main():
+    packages = make_packages(SIZE, random.Random(0))
+    csv_text = ''.join('%s,%s\n' % (code, ','.join(map(str, data)))
+                       for code, data in packages)
+    json_text = ''.join(json.dumps(package) + '\n' for package in packages)
+    binary = io.BytesIO()
+    homework.write_binary(packages, binary)
+    binary = binary.getvalue()
+
+    runs = {
+        'csv': lambda: consume(
+            homework.iter_packages(io.StringIO(csv_text))),
+        'jsonl': lambda: consume(
+            homework.iter_packages(io.StringIO(json_text))),
+        'binary': lambda: consume(homework.iter_binary_packages(binary)),
+        'binary decode only': lambda: sum(
+            1 for _ in homework.iter_binary_packages(binary)),
+        'binary columns + batch': lambda: [
+            homework.calculate_batch(code, columns) for code, columns
+            in homework.decode_binary_columns(binary).items()],
+    }
+    print(f'sizes: csv {len(csv_text.encode())} B, '
+          f'jsonl {len(json_text.encode())} B, binary {len(binary)} B')
+    for name, run in runs.items():
+        elapsed = min(timeit.repeat(run, number=1, repeat=3))
+        print(f'{name}: {SIZE / elapsed:,.0f} pkg/s')
+
+
+if __name__ == '__main__':
+    main()
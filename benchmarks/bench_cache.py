@@ -0,0 +1,53 @@
+"""Обработка потока с кэшем при разной доле повторов."""
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+from suite import make_packages  # noqa: E402
+
+SIZE = 200_000
+CAPACITY = 4096
+
+
+def with_duplicates(packages, ratio, rnd):
+    """Заменить долю ratio пакетов повторами недавних пакетов."""
+    stream = []
+    for package in packages:
+        if stream and rnd.random() < ratio:
+            package = stream[-rnd.randint(1, min(len(stream), 1000))]
+        stream.append(package)
+    return stream
+
+
+def consume(messages):
+    for _ in messages:
+        pass
+
+
+def run_cached(stream):
+    cache = homework.PackageCache(CAPACITY)
+    consume(homework.iter_messages(stream, cache))
+    return cache
+
+
+def main():
+    rnd = random.Random(0)
+    packages = make_packages(SIZE, rnd)
+    for ratio in (0.0, 0.5, 0.9, 0.99):
+        stream = with_duplicates(packages, ratio, rnd)
+        plain = min(timeit.repeat(
+            lambda: consume(homework.iter_messages(stream)),
+            number=1, repeat=3))
+        cached = min(timeit.repeat(
+            lambda: run_cached(stream), number=1, repeat=3))
+        print(f'duplicates {ratio:.0%}: plain {plain / SIZE * 1e9:,.0f} '
+              f'ns/pkg, cached {cached / SIZE * 1e9:,.0f} ns/pkg, '
+              f'{run_cached(stream).stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Стоимость диспетчеризации read_package до и после реестра."""
+import sys
+import timeit
+from pathlib import Path
+from typing import Dict, List, Type
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+from homework import Running, SportsWalking, Swimming, Training  # noqa: E402
+
+NUMBER = 500_000
+
+
+def read_package_rebuild(workout_type: str, data: List[int]) -> Training:
+    """read_package в исходном виде: словарь собирается на каждый вызов."""
+    training_codes_and_classes_mapping: Dict[str, Type[Training]] = {
+        'SWM': Swimming,
+        'RUN': Running,
+        'WLK': SportsWalking
+    }
+    if workout_type in training_codes_and_classes_mapping:
+        return training_codes_and_classes_mapping[workout_type](*data)
+    raise KeyError(workout_type)
+
+
+def main():
+    data = [15000, 1, 75]
+    construct = min(timeit.repeat(
+        lambda: Running(*data), number=NUMBER, repeat=5))
+    for name, function in (('rebuild', read_package_rebuild),
+                           ('registry', homework.read_package)):
+        elapsed = min(timeit.repeat(
+            lambda: function('RUN', data), number=NUMBER, repeat=5))
+        print(f'{name}: {(elapsed - construct) / NUMBER * 1e9:.0f} ns '
+              f'per dispatch ({elapsed / NUMBER * 1e9:.0f} ns with init)')
+
+
+if __name__ == '__main__':
+    main()
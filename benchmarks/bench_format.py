@@ -0,0 +1,43 @@
+"""Сравнение форматирования через asdict и скомпилированного шаблона.
+Поток mixed чередует сообщения двух классов с разными шаблонами.
+"""
+import sys
+import timeit
+from dataclasses import asdict
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+
+SIZE = 200_000
+
+
+class ShortMessage(homework.InfoMessage):
+    __slots__ = ()
+    INFO_MESSAGE = '{training_type}: {distance:.3f} км'
+
+
+def main():
+    messages = [homework.InfoMessage('Running', 1.5, i / 7, i / 11, i / 3)
+                for i in range(SIZE)]
+    mixed = [(ShortMessage if i % 2 else homework.InfoMessage)(
+        'Running', 1.5, i / 7, i / 11, i / 3) for i in range(SIZE)]
+    template = homework.InfoMessage.INFO_MESSAGE
+    runs = {
+        'asdict + format': lambda: '\n'.join(
+            [template.format(**asdict(info)) for info in messages]),
+        'get_message': lambda: '\n'.join(
+            [info.get_message() for info in messages]),
+        'format_many': lambda: homework.format_many(messages),
+        'mixed get_message': lambda: '\n'.join(
+            [info.get_message() for info in mixed]),
+        'mixed format_many': lambda: homework.format_many(mixed),
+    }
+    for name, run in runs.items():
+        elapsed = min(timeit.repeat(run, number=1, repeat=3))
+        print(f'{name}: {SIZE / elapsed:,.0f} msg/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Память на одну тренировку и одно сообщение: со слотами и без."""
+import inspect
+import sys
+import tracemalloc
+from dataclasses import fields, make_dataclass
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+
+SIZE = 100_000
+PACKAGES = {
+    'SWM': [720, 1.5, 80, 25, 40],
+    'RUN': [15000, 1.5, 75],
+    'WLK': [9000, 1.5, 75, 180],
+}
+
+
+def plain_class(training_class):
+    """Класс с теми же атрибутами, но с обычным __dict__."""
+    names = list(inspect.signature(training_class).parameters)
+
+    def __init__(self, *args):
+        for name, value in zip(names, args):
+            setattr(self, name, value)
+
+    return type('Plain' + training_class.__name__, (), {'__init__': __init__})
+
+
+def bytes_per_object(factory):
+    tracemalloc.start()
+    objects = [factory() for _ in range(SIZE)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size / SIZE
+
+
+def main():
+    for code, data in PACKAGES.items():
+        training_class = homework.TRAINING_CODES_AND_CLASSES[code]
+        plain = plain_class(training_class)
+        before = bytes_per_object(lambda: plain(*data))
+        after = bytes_per_object(lambda: training_class(*data))
+        print(f'{training_class.__name__}: {before:.0f} -> {after:.0f} B')
+
+    plain_info = make_dataclass(
+        'PlainInfoMessage', [field.name for field in fields(
+            homework.InfoMessage)])
+    args = ('Running', 1.5, 9.75, 6.5, 699.75)
+    before = bytes_per_object(lambda: plain_info(*args))
+    after = bytes_per_object(lambda: homework.InfoMessage(*args))
+    print(f'InfoMessage: {before:.0f} -> {after:.0f} B')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Масштабирование параллельной обработки от 1 до N процессов."""
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+
+SIZE = 500_000
+
+
+def write_packages(path, size, rnd):
+    with open(path, 'w', encoding='utf-8') as dst:
+        for _ in range(size):
+            code = rnd.choice(('SWM', 'RUN', 'WLK'))
+            data = [rnd.randint(100, 20000), rnd.randint(1, 3),
+                    rnd.randint(40, 120)]
+            if code == 'WLK':
+                data.append(rnd.randint(140, 210))
+            if code == 'SWM':
+                data += [rnd.choice((25, 50)), rnd.randint(1, 80)]
+            dst.write('%s,%s\n' % (code, ','.join(map(str, data))))
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'packages.csv')
+        write_packages(path, SIZE, random.Random(0))
+        start = time.perf_counter()
+        with open(path, encoding='utf-8') as src:
+            homework.process_stream(src, io.StringIO())
+        base = time.perf_counter() - start
+        print(f'stream: {SIZE / base:,.0f} pkg/s')
+        for workers in range(1, max_workers + 1):
+            for ordered in (True, False):
+                start = time.perf_counter()
+                homework.process_file_parallel(
+                    path, io.StringIO(), workers, ordered, 1 << 20)
+                elapsed = time.perf_counter() - start
+                print(f'workers={workers} ordered={ordered}: '
+                      f'{SIZE / elapsed:,.0f} pkg/s, x{base / elapsed:.2f}')
+
+
+if __name__ == '__main__':
+    main()
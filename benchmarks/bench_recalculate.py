@@ -0,0 +1,78 @@
+"""Пересчет показателей при смене констант против полной обработки."""
+import inspect
+import random
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+from suite import make_packages  # noqa: E402
+
+SIZE = 200_000
+CHANGES = {
+    'RUN calories': {'RUN': {'COEF_CALL_1': 18.5}},
+    'WLK calories': {'WLK': {'COEF_CALL_2': 0.03}},
+    'SWM distance': {'SWM': {'LEN_STEP': 1.4}},
+}
+
+
+def split_columns(packages):
+    """Разложить пакеты в колонки параметров по видам тренировок."""
+    columns = {}
+    for workout_type, data in packages:
+        names = list(inspect.signature(
+            homework.TRAINING_CODES_AND_CLASSES[workout_type]).parameters)
+        group = columns.setdefault(workout_type, {name: [] for name in names})
+        for name, value in zip(names, data):
+            group[name].append(value)
+    return columns
+
+
+def full(packages, version):
+    for workout_type, data in packages:
+        homework.versioned_class(
+            homework.TRAINING_CODES_AND_CLASSES[workout_type],
+            workout_type, version)(*data).show_training_record()
+
+
+def main():
+    packages = make_packages(SIZE, random.Random(0))
+    columns = split_columns(packages)
+    stored = {workout_type: homework.calculate_batch(workout_type, group)
+              for workout_type, group in columns.items()}
+    with tempfile.TemporaryDirectory() as path:
+        store = homework.WorkoutStore(path + '/base')
+        store.extend(packages)
+        store.flush()
+        for number, (name, coefficients) in enumerate(CHANGES.items()):
+            version = 'bench%d' % number
+            homework.register_coefficients(version, coefficients)
+            reprocess = min(timeit.repeat(
+                lambda: full(packages, version), number=1, repeat=3))
+            batch = min(timeit.repeat(lambda: [
+                homework.versioned_class(
+                    homework.TRAINING_CODES_AND_CLASSES[workout_type],
+                    workout_type, version).calculate_batch(group)
+                for workout_type, group in columns.items()],
+                number=1, repeat=3))
+            incremental = min(timeit.repeat(lambda: [
+                homework.recalculate_batch(
+                    workout_type, group, stored[workout_type], None, version)
+                for workout_type, group in columns.items()],
+                number=1, repeat=3))
+            rebuild = timeit.timeit(lambda: homework.WorkoutStore(
+                f'{path}/full{number}').extend(packages), number=1)
+            recalculate = timeit.timeit(lambda: store.recalculate(
+                f'{path}/recalc{number}', None, version), number=1)
+            print(f'{name}: reprocess {reprocess * 1e3:,.0f} ms, '
+                  f'batch {batch * 1e3:,.0f} ms, '
+                  f'incremental {incremental * 1e3:,.0f} ms; '
+                  f'store rebuild {rebuild * 1e3:,.0f} ms, '
+                  f'store recalculate {recalculate * 1e3:,.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
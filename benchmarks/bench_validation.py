@@ -0,0 +1,35 @@
+"""Накладные расходы проверки пакетов в потоковой обработке."""
+import io
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+from suite import make_packages  # noqa: E402
+
+SIZE = 200_000
+
+
+def main():
+    packages = make_packages(SIZE, random.Random(0))
+    text = ''.join('%s,%s\n' % (code, ','.join(map(str, data)))
+                   for code, data in packages)
+    sink = homework.RejectSink()
+    runs = {
+        'validate only': lambda: sum(
+            1 for _ in homework.filter_valid(packages, sink)),
+        'stream': lambda: homework.process_stream(
+            io.StringIO(text), io.StringIO()),
+        'stream + validation': lambda: homework.process_stream(
+            io.StringIO(text), io.StringIO(), reject=sink),
+    }
+    for name, run in runs.items():
+        elapsed = min(timeit.repeat(run, number=1, repeat=3))
+        print(f'{name}: {elapsed / SIZE * 1e9:,.0f} ns/pkg')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Нагрузочный тест сервера приема пакетов.
+
+Запуск: python benchmarks/load_test.py [--host H --port P] [--clients N]
+Без --port сервер поднимается в этом же процессе на свободном порту.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+
+LINES = [b'SWM,720,1,80,25,40\n', b'RUN,15000,1,75\n', b'WLK,9000,1,75,180\n']
+
+
+async def client(host, port, requests, latencies, rnd):
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(requests):
+        start = time.perf_counter()
+        writer.write(rnd.choice(LINES))
+        await reader.readline()
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(args):
+    server = None
+    port = args.port
+    if port is None:
+        server = await homework.start_server(args.host, 0)
+        port = server.sockets[0].getsockname()[1]
+    latencies = []
+    rnd = random.Random(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(args.host, port, args.requests, latencies, rnd)
+        for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'clients={args.clients} packages={len(latencies)}: '
+          f'{len(latencies) / elapsed:,.0f} pkg/s, '
+          f'p50 {quantiles[49] * 1e3:.2f} ms, p99 {quantiles[98] * 1e3:.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
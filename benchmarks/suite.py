@@ -0,0 +1,185 @@
+"""Набор бенчмарков горячих путей homework.py.
+
+Запуск:
+    python benchmarks/suite.py                       # 1e3..1e5 пакетов
+    python benchmarks/suite.py --scales 1e3 1e7      # свои масштабы
+    python benchmarks/suite.py --save-baseline       # сохранить базу
+    python benchmarks/suite.py --baseline benchmarks/baseline.json
+
+Результаты пишутся в JSON (нс на операцию), отдельно замеряется время
+импорта homework. При сравнении с базой
+регрессия больше --tolerance завершает запуск с кодом 1.
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+from itertools import islice, cycle
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import homework  # noqa: E402
+
+POOL_SIZE = 100_000
+MIX = {'RUN': 0.5, 'WLK': 0.3, 'SWM': 0.2}
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def make_package(workout_type, rnd):
+    """Пакет с правдоподобными значениями датчиков."""
+    data = [rnd.randint(500, 25000), round(rnd.uniform(0.25, 3), 2),
+            rnd.randint(45, 110)]
+    if workout_type == 'WLK':
+        data.append(rnd.randint(150, 200))
+    if workout_type == 'SWM':
+        data[0] //= 10
+        data += [rnd.choice((25, 50)), rnd.randint(4, 80)]
+    return workout_type, data
+
+
+def make_packages(size, rnd, mix=MIX):
+    codes = rnd.choices(list(mix), weights=list(mix.values()), k=size)
+    return [make_package(code, rnd) for code in codes]
+
+
+def bench_read_package(packages, scale):
+    read_package = homework.read_package
+    start = time.perf_counter()
+    for workout_type, data in islice(cycle(packages), scale):
+        read_package(workout_type, data)
+    return time.perf_counter() - start
+
+
+def bench_calories(workout_type):
+    def bench(packages, scale):
+        trainings = [homework.read_package(*package) for package in packages
+                     if package[0] == workout_type]
+        start = time.perf_counter()
+        for training in islice(cycle(trainings), scale):
+            training.get_spent_calories()
+        return time.perf_counter() - start
+    return bench
+
+
+def bench_show_training_info(packages, scale):
+    trainings = [homework.read_package(*package) for package in packages]
+    start = time.perf_counter()
+    for training in islice(cycle(trainings), scale):
+        training.show_training_info()
+    return time.perf_counter() - start
+
+
+def bench_get_message(packages, scale):
+    messages = [homework.read_package(*package).show_training_info()
+                for package in packages]
+    start = time.perf_counter()
+    for info in islice(cycle(messages), scale):
+        info.get_message()
+    return time.perf_counter() - start
+
+
+def bench_pipeline(packages, scale):
+    start = time.perf_counter()
+    homework.format_many(homework.iter_messages(
+        islice(cycle(packages), scale)))
+    return time.perf_counter() - start
+
+
+def bench_records(kernels):
+    def bench(packages, scale):
+        start = time.perf_counter()
+        for _ in homework.iter_records(islice(cycle(packages), scale),
+                                       kernels):
+            pass
+        return time.perf_counter() - start
+    return bench
+
+
+def bench_import_time(repeat):
+    """Время импорта homework в новом интерпретаторе за вычетом запуска."""
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+        return time.perf_counter() - start
+
+    run('import homework')
+    startup = min(run('pass') for _ in range(repeat))
+    return min(run('import homework') for _ in range(repeat)) - startup
+
+
+CASES = {
+    'read_package': bench_read_package,
+    'Running.get_spent_calories': bench_calories('RUN'),
+    'SportsWalking.get_spent_calories': bench_calories('WLK'),
+    'Swimming.get_spent_calories': bench_calories('SWM'),
+    'show_training_info': bench_show_training_info,
+    'InfoMessage.get_message': bench_get_message,
+    'pipeline': bench_pipeline,
+    'iter_records': bench_records(False),
+    'iter_records kernels': bench_records(True),
+}
+
+
+def run(scales, repeat, selected):
+    packages = make_packages(min(max(scales), POOL_SIZE), random.Random(0))
+    results = {}
+    for name, bench in CASES.items():
+        if selected and name not in selected:
+            continue
+        results[name] = {}
+        for scale in scales:
+            elapsed = min(bench(packages, scale) for _ in range(repeat))
+            results[name][str(scale)] = elapsed / scale * 1e9
+            print(f'{name:34} {scale:>10,}: '
+                  f'{results[name][str(scale)]:8.0f} ns/op')
+    if not selected or 'import' in selected:
+        results['import'] = {'1': bench_import_time(max(repeat, 5)) * 1e9}
+        print(f'{"import":34} {1:>10,}: {results["import"]["1"]:8.0f} ns/op')
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, scales in results.items():
+        for scale, value in scales.items():
+            base = baseline.get(name, {}).get(scale)
+            if base and value > base * (1 + tolerance):
+                regressions.append(
+                    f'{name} @ {scale}: {base:.0f} -> {value:.0f} ns/op '
+                    f'(+{(value / base - 1) * 100:.0f}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', nargs='+', type=float,
+                        default=[1e3, 1e4, 1e5])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--case', action='append', dest='cases')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', type=Path)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    scales = [int(scale) for scale in args.scales]
+    results = run(scales, args.repeat, args.cases)
+    with open(args.output, 'w', encoding='utf-8') as dst:
+        json.dump(results, dst, indent=2)
+    if args.save_baseline:
+        with open(args.baseline or BASELINE, 'w', encoding='utf-8') as dst:
+            json.dump(results, dst, indent=2)
+    elif args.baseline:
+        with open(args.baseline, encoding='utf-8') as src:
+            regressions = compare(results, json.load(src), args.tolerance)
+        if regressions:
+            print('REGRESSIONS:', *regressions, sep='\n  ', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,55 @@
-from typing import ClassVar, Dict, List, Type
-from dataclasses import asdict, dataclass
+import bisect
+import heapq
+import inspect
+import io
+import json
+import math
+import mmap
+import os
+import queue
+import re
+import string
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from contextlib import ExitStack
+from functools import lru_cache
+from itertools import accumulate, islice, product, starmap
+from operator import attrgetter, ge, gt, le
+from typing import (TYPE_CHECKING, Any, BinaryIO, Callable, ClassVar, Dict,
+                    Hashable, Iterable, Iterator, List, NamedTuple, Optional,
+                    Sequence, TextIO, Tuple, Type, TypeVar, Union)
+from dataclasses import dataclass
+
+if TYPE_CHECKING:
+    import argparse
+    import asyncio
+
+Columns = Dict[str, Sequence[float]]
+Package = Tuple[str, List[float]]
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+INFO_FIELDS: Tuple[str, ...] = (
+    'training_type', 'duration', 'distance', 'speed', 'calories')
+get_info_fields = attrgetter(*INFO_FIELDS)
+
+CHUNK_SIZE: int = 1 << 16
+BUFFER_SIZE: int = 1024
+SHARD_SIZE: int = 1 << 23
+MAX_LINE_SIZE: int = 1 << 16
 
 
 @dataclass
 class InfoMessage:
     """Информационное сообщение о тренировке."""
 
+    __slots__ = ('training_type', 'duration', 'distance', 'speed',
+                 'calories')
+
     training_type: str
     duration: float
     distance: float
@@ -22,14 +66,246 @@ class InfoMessage:
 
     def get_message(self) -> str:
         """Формирует и возврящает строку о тренировке."""
-        return self.INFO_MESSAGE.format(**asdict(self))
+        return compile_message(self.INFO_MESSAGE)(
+            self.training_type, self.duration, self.distance,
+            self.speed, self.calories)
+
+
+class InfoRecord(NamedTuple):
+    """Поля информационного сообщения без текста для машинной обработки."""
+
+    training_type: str
+    duration: float
+    distance: float
+    speed: float
+    calories: float
+
+
+class InfoColumns:
+    """Поля сообщений по колонкам: числа в массивах array('d').
+    Массивы поддерживают протокол буфера, поэтому их можно передать,
+    например, в numpy.frombuffer без копирования. При size > 0 массивы
+    выделяются заранее и заполняются по месту.
+    """
+
+    def __init__(self, size: int = 0) -> None:
+        self.training_type: List[str] = [''] * size
+        self.duration = array('d', bytes(8 * size))
+        self.distance = array('d', bytes(8 * size))
+        self.speed = array('d', bytes(8 * size))
+        self.calories = array('d', bytes(8 * size))
+        self.size = 0
+
+    def append(self, training_type: str, duration: float, distance: float,
+               speed: float, calories: float) -> None:
+        """Добавить поля одного сообщения."""
+        index = self.size
+        if index < len(self.duration):
+            self.training_type[index] = training_type
+            self.duration[index] = duration
+            self.distance[index] = distance
+            self.speed[index] = speed
+            self.calories[index] = calories
+        else:
+            self.training_type.append(training_type)
+            self.duration.append(duration)
+            self.distance.append(distance)
+            self.speed.append(speed)
+            self.calories.append(calories)
+        self.size += 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int) -> InfoRecord:
+        if not -self.size <= index < self.size:
+            raise IndexError('InfoColumns index out of range')
+        index %= self.size
+        return InfoRecord(self.training_type[index], self.duration[index],
+                          self.distance[index], self.speed[index],
+                          self.calories[index])
+
+    def columns(self) -> Dict[str, Sequence[Any]]:
+        """Вернуть заполненную часть колонок по именам INFO_FIELDS."""
+        return {name: getattr(self, name)[:self.size]
+                for name in INFO_FIELDS}
+
+
+@lru_cache(maxsize=None)
+def compile_message(template: str) -> Callable[..., str]:
+    """Скомпилировать шаблон с именованными полями InfoMessage.
+    Возвращает функцию форматирования, которая принимает значения полей
+    по порядку INFO_FIELDS и дает тот же результат, что и template.format.
+    """
+    parts = []
+    for literal, name, spec, conversion in string.Formatter().parse(
+            template):
+        parts.append(literal.replace('{', '{{').replace('}', '}}'))
+        if name is not None:
+            parts.append('{%d%s%s}' % (
+                INFO_FIELDS.index(name),
+                '!' + conversion if conversion else '',
+                ':' + spec if spec else ''))
+    return ''.join(parts).format
+
+
+def format_many(messages: Iterable[InfoMessage]) -> str:
+    """Сформировать текст сообщений, каждое с новой строки.
+    Строки собираются в один список и склеиваются один раз, шаблон
+    компилируется один раз на класс сообщения.
+    """
+    formatters: Dict[type, Callable[..., str]] = {}
+    lines: List[str] = []
+    append = lines.append
+    for info in messages:
+        message_class = info.__class__
+        formatter = formatters.get(message_class)
+        if formatter is None:
+            formatter = formatters[message_class] = compile_message(
+                message_class.INFO_MESSAGE)
+        append(formatter(info.training_type, info.duration, info.distance,
+                         info.speed, info.calories))
+    append('')
+    return '\n'.join(lines)
+
+
+def format_csv(messages: Iterable[InfoMessage]) -> str:
+    """Сформировать строки CSV с полями сообщений без заголовка."""
+    return ''.join('%s,%r,%r,%r,%r\n' % get_info_fields(info)
+                   for info in messages)
+
+
+def format_jsonl(messages: Iterable[InfoMessage]) -> str:
+    """Сформировать по JSON-объекту с полями на каждое сообщение."""
+    return ''.join(
+        json.dumps(dict(zip(INFO_FIELDS, get_info_fields(info))),
+                   ensure_ascii=False) + '\n'
+        for info in messages)
+
+
+def format_columnar(messages: Iterable[InfoMessage]) -> str:
+    """Сформировать группу строк: JSON-объект с колонкой на каждое поле."""
+    columns = list(zip(*map(get_info_fields, messages)))
+    if not columns:
+        return ''
+    return json.dumps(dict(zip(INFO_FIELDS, map(list, columns))),
+                      ensure_ascii=False) + '\n'
+
+
+OUTPUT_FORMATS: Dict[str, Callable[[List[InfoMessage]], str]] = {
+    'text': format_many,
+    'csv': format_csv,
+    'jsonl': format_jsonl,
+    'columnar': format_columnar,
+}
+OUTPUT_HEADERS: Dict[str, str] = {
+    'csv': ','.join(INFO_FIELDS) + '\n',
+}
+
+
+TRAINING_CODES_AND_CLASSES: Dict[str, Type['Training']] = {}
+TRAINING_REGISTRY: Dict[str, Tuple[Type['Training'], int, int]] = {}
+BINARY_FORMATS: Dict[str, struct.Struct] = {}
+VALIDATORS: Dict[str, Callable[[Sequence[Any]], Optional[str]]] = {}
+
+TrainingClass = TypeVar('TrainingClass', bound=Type['Training'])
+
+
+def register_training(
+        workout_type: str,
+        binary_format: Optional[str] = None
+) -> Callable[[TrainingClass], TrainingClass]:
+    """Декоратор регистрации вида тренировки под кодом workout_type.
+    Допустимое количество параметров пакета вычисляется один раз по
+    сигнатуре класса. binary_format задает формат struct для бинарной
+    записи: трехбайтовый код и параметры пакета.
+    """
+    def register(training_class: TrainingClass) -> TrainingClass:
+        if workout_type in TRAINING_REGISTRY:
+            raise ValueError(
+                "Вид тренировки с ключем '%s' уже зарегистрирован."
+                % (workout_type))
+        params = inspect.signature(training_class).parameters.values()
+        if any(param.kind == param.VAR_POSITIONAL for param in params):
+            max_args = sys.maxsize
+        else:
+            max_args = len(params)
+        min_args = sum(param.default is param.empty and param.kind in (
+            param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD)
+            for param in params)
+        TRAINING_CODES_AND_CLASSES[workout_type] = training_class
+        TRAINING_REGISTRY[workout_type] = (training_class, min_args, max_args)
+        VALIDATORS.pop(workout_type, None)
+        if binary_format is not None:
+            BINARY_FORMATS[workout_type] = struct.Struct(binary_format)
+        return training_class
+
+    return register
+
+
+def unregister_training(workout_type: str) -> None:
+    """Удалить вид тренировки из реестра."""
+    del TRAINING_REGISTRY[workout_type]
+    del TRAINING_CODES_AND_CLASSES[workout_type]
+    BINARY_FORMATS.pop(workout_type, None)
+    VALIDATORS.pop(workout_type, None)
+
+
+def load_training_plugins(group: str = 'homework.trainings') -> None:
+    """Зарегистрировать виды тренировок из entry points пакетов.
+    Имя entry point — код тренировки, значение — подкласс Training.
+    """
+    import importlib.metadata
+
+    entry_points = importlib.metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        selected = entry_points.select(group=group)
+    else:
+        selected = entry_points.get(group, [])
+    for entry_point in selected:
+        if entry_point.name not in TRAINING_REGISTRY:
+            register_training(entry_point.name)(entry_point.load())
+
+
+Method = TypeVar('Method', bound=Callable[..., float])
+
+
+def formula(expression: str) -> Callable[[Method], Method]:
+    """Декоратор: записать формулу метода этапа для сборки ядра.
+    Выражение использует параметры тренировки, константы класса и
+    результаты прошлых этапов distance и speed. Формула привязана к
+    объекту функции, поэтому замененный метод формулы не имеет.
+    """
+    def decorate(method: Method) -> Method:
+        method.formula = expression  # type: ignore[attr-defined]
+        return method
+    return decorate
+
+
+def accepting(function: Callable[..., Any],
+              name: str) -> Optional[Callable[..., Any]]:
+    """Вернуть функцию, если она принимает аргумент name, иначе None."""
+    return function if name in inspect.signature(function).parameters else (
+        None)
 
 
 class Training:
-    """Базовый класс тренировки."""
+    """Базовый класс тренировки.
+    Параметры хранятся в слотах. Слот __dict__ оставлен для переопределения
+    констант и методов у отдельного экземпляра, словарь создается только
+    при таком переопределении. metric_functions — функции get_mean_speed
+    и get_spent_calories подкласса, принимающие дистанцию и скорость:
+    get_metrics передает их, только если экземпляр обращается именно к
+    этим функциям. Декоратор formula у методов этапов хранит их формулы
+    для сборки ядер.
+    """
+
+    __slots__ = ('action', 'duration', 'weight', '__dict__')
 
     M_IN_KM: int = 1000
     LEN_STEP: float = 0.65
+    metric_functions: ClassVar[Tuple[Optional[Callable[..., float]], ...]] = (
+        None, None)
 
     def __init__(self,
                  action: int,
@@ -40,14 +316,48 @@ class Training:
         self.duration = duration
         self.weight = weight
 
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.metric_functions = (
+            accepting(cls.get_mean_speed, 'distance'),
+            accepting(cls.get_spent_calories, 'speed'))
+
+    def get_metrics(self) -> Tuple[float, float, float]:
+        """Получить дистанцию, среднюю скорость и калории за один проход.
+        Дистанция и скорость считаются один раз и передаются следующему
+        этапу, если метод — функция подкласса, которая их принимает.
+        Методы, замененные у класса или экземпляра позже, вызываются без
+        аргументов.
+        """
+        speed_function, calories_function = self.metric_functions
+        distance = self.get_distance()
+        get_mean_speed = self.get_mean_speed
+        if speed_function is not None and (
+                getattr(get_mean_speed, '__func__', None) is speed_function):
+            speed = get_mean_speed(distance)
+        else:
+            speed = get_mean_speed()
+        get_spent_calories = self.get_spent_calories
+        if calories_function is not None and getattr(
+                get_spent_calories, '__func__', None) is calories_function:
+            calories = get_spent_calories(speed)
+        else:
+            calories = get_spent_calories()
+        return distance, speed, calories
+
+    @formula('action * LEN_STEP / M_IN_KM')
     def get_distance(self) -> float:
         """Получить дистанцию в км."""
         distance: float = self.action * self.LEN_STEP / self.M_IN_KM
         return distance
 
-    def get_mean_speed(self) -> float:
-        """Получить среднюю скорость движения."""
-        distance: float = self.get_distance()
+    @formula('distance / duration')
+    def get_mean_speed(self, distance: Optional[float] = None) -> float:
+        """Получить среднюю скорость движения.
+        distance можно передать, если дистанция уже посчитана.
+        """
+        if distance is None:
+            distance = self.get_distance()
         mean_speed: float = distance / self.duration
         return mean_speed
 
@@ -56,40 +366,100 @@ class Training:
         raise NotImplementedError(
             "Определите get_spent_calories в %s." % (self.__class__.__name__))
 
+    def show_training_record(self) -> InfoRecord:
+        """Вернуть поля информационного сообщения без форматирования."""
+        return InfoRecord(self.__class__.__name__, self.duration,
+                          *self.get_metrics())
+
     def show_training_info(self) -> InfoMessage:
         """Вернуть информационное сообщение о выполненной тренировке."""
         training_type = self.__class__.__name__
-        distance = self.get_distance()
-        speed = self.get_mean_speed()
-        calories = self.get_spent_calories()
+        distance, speed, calories = self.get_metrics()
         info: InfoMessage = InfoMessage(training_type, self.duration,
                                         distance, speed, calories)
         return info
 
+    @classmethod
+    def get_batch_distance(cls, columns: Columns) -> List[float]:
+        """Получить дистанции в км для колонки action."""
+        len_step = cls.LEN_STEP
+        m_in_km = cls.M_IN_KM
+        return [action * len_step / m_in_km for action in columns['action']]
+
+    @classmethod
+    def get_batch_mean_speed(cls, columns: Columns,
+                             distance: List[float]) -> List[float]:
+        """Получить средние скорости для колонок тренировок."""
+        return [dist / duration
+                for dist, duration in zip(distance, columns['duration'])]
+
+    @classmethod
+    def get_batch_spent_calories(cls, columns: Columns,
+                                 speed: List[float]) -> List[float]:
+        """Получить затраченные калории для колонок тренировок."""
+        raise NotImplementedError(
+            "Определите get_batch_spent_calories в %s." % (cls.__name__))
+
+    @classmethod
+    def calculate_batch(cls, columns: Columns) -> Dict[str, List[float]]:
+        """Рассчитать дистанцию, скорость и калории для колонок сразу.
+        Результат совпадает с расчетом по объектам для каждой строки.
+        """
+        distance = cls.get_batch_distance(columns)
+        speed = cls.get_batch_mean_speed(columns, distance)
+        calories = cls.get_batch_spent_calories(columns, speed)
+        return {'distance': distance, 'speed': speed, 'calories': calories}
+
 
+@register_training('RUN', '<3sIdd')
 class Running(Training):
     """Тренировка: бег."""
 
+    __slots__ = ()
+
     COEF_CALL_1: float = 18
     COEF_CALL_2: float = 20
     MIN_IN_HOUR: int = 60
 
-    def get_spent_calories(self) -> float:
+    @formula('(COEF_CALL_1 * speed - COEF_CALL_2)'
+             ' * weight / M_IN_KM * (duration * MIN_IN_HOUR)')
+    def get_spent_calories(self, speed: Optional[float] = None) -> float:
         """Получить кол-во затраченных калорий при беге, по формуле:
         (18 * средняя_скорость - 20)
          * вес_спортсмена / M_IN_KM * время_тренировки_в_минутах.
+        speed можно передать, если скорость уже посчитана.
         """
+        if speed is None:
+            speed = self.get_mean_speed()
         duration_min = self.duration * self.MIN_IN_HOUR
         spent_calories: float = (
-            (self.COEF_CALL_1 * self.get_mean_speed() - self.COEF_CALL_2)
+            (self.COEF_CALL_1 * speed - self.COEF_CALL_2)
             * self.weight / self.M_IN_KM * duration_min
         )
         return spent_calories
 
+    @classmethod
+    def get_batch_spent_calories(cls, columns: Columns,
+                                 speed: List[float]) -> List[float]:
+        """Калории при беге для колонок тренировок."""
+        coef_1 = cls.COEF_CALL_1
+        coef_2 = cls.COEF_CALL_2
+        m_in_km = cls.M_IN_KM
+        min_in_hour = cls.MIN_IN_HOUR
+        return [
+            (coef_1 * mean_speed - coef_2)
+            * weight / m_in_km * (duration * min_in_hour)
+            for mean_speed, weight, duration
+            in zip(speed, columns['weight'], columns['duration'])
+        ]
 
+
+@register_training('WLK', '<3sIddd')
 class SportsWalking(Training):
     """Тренировка: спортивная ходьба."""
 
+    __slots__ = ('height',)
+
     COEF_CALL_1: float = 0.035
     COEF_CALL_2: float = 0.029
     MIN_IN_HOUR: int = 60
@@ -100,23 +470,47 @@ class SportsWalking(Training):
         super().__init__(action, duration, weight)
         self.height = height
 
-    def get_spent_calories(self) -> float:
+    @formula('(COEF_CALL_1 * weight + (speed ** 2 // height)'
+             ' * COEF_CALL_2 * weight) * (duration * MIN_IN_HOUR)')
+    def get_spent_calories(self, speed: Optional[float] = None) -> float:
         """Расчет кол-ва затраченных калорий при ходьбе по формуле:
         (0.035 * вес + (средняя_скорость**2 // рост) * 0.029 * вес)
         * время_тренировки_в_минутах.
+        speed можно передать, если скорость уже посчитана.
         """
+        if speed is None:
+            speed = self.get_mean_speed()
         duration_min = self.duration * self.MIN_IN_HOUR
         spent_calories: float = (
             (self.COEF_CALL_1 * self.weight
-                + (self.get_mean_speed()**2 // self.height)
+                + (speed**2 // self.height)
                 * self.COEF_CALL_2 * self.weight) * duration_min
         )
         return spent_calories
 
+    @classmethod
+    def get_batch_spent_calories(cls, columns: Columns,
+                                 speed: List[float]) -> List[float]:
+        """Калории при ходьбе для колонок тренировок."""
+        coef_1 = cls.COEF_CALL_1
+        coef_2 = cls.COEF_CALL_2
+        min_in_hour = cls.MIN_IN_HOUR
+        return [
+            (coef_1 * weight
+                + (mean_speed**2 // height) * coef_2 * weight)
+            * (duration * min_in_hour)
+            for mean_speed, weight, height, duration in zip(
+                speed, columns['weight'], columns['height'],
+                columns['duration'])
+        ]
+
 
+@register_training('SWM', '<3sIdddI')
 class Swimming(Training):
     """Тренировка: плавание."""
 
+    __slots__ = ('length_pool', 'count_pool')
+
     LEN_STEP: float = 1.38
     COEF_CALL_1: float = 1.1
     COEF_CALL_2: float = 2
@@ -127,36 +521,125 @@ class Swimming(Training):
         self.length_pool = length_pool
         self.count_pool = count_pool
 
-    def get_mean_speed(self) -> float:
+    @formula('length_pool * count_pool / M_IN_KM / duration')
+    def get_mean_speed(self, distance: Optional[float] = None) -> float:
         """Pассчитывает среднюю скорость при плавании по формуле:
         длина_бассейна * count_pool / M_IN_KM / время_тренировки.
+        Дистанция по гребкам в формуле не используется.
         """
         mean_speed: float = (
             self.length_pool * self.count_pool / self.M_IN_KM / self.duration
         )
         return mean_speed
 
-    def get_spent_calories(self) -> float:
-        """Затрат калорий пли плавании: (средняя_скорость + 1.1) * 2 * вес."""
+    @formula('(speed + COEF_CALL_1) * COEF_CALL_2 * weight')
+    def get_spent_calories(self, speed: Optional[float] = None) -> float:
+        """Затрат калорий пли плавании: (средняя_скорость + 1.1) * 2 * вес.
+        speed можно передать, если скорость уже посчитана.
+        """
+        if speed is None:
+            speed = self.get_mean_speed()
         spent_calories: float = (
-            (self.get_mean_speed() + self.COEF_CALL_1)
+            (speed + self.COEF_CALL_1)
             * self.COEF_CALL_2 * self.weight
         )
         return spent_calories
 
+    @classmethod
+    def get_batch_mean_speed(cls, columns: Columns,
+                             distance: List[float]) -> List[float]:
+        """Средние скорости при плавании для колонок тренировок."""
+        m_in_km = cls.M_IN_KM
+        return [
+            length_pool * count_pool / m_in_km / duration
+            for length_pool, count_pool, duration in zip(
+                columns['length_pool'], columns['count_pool'],
+                columns['duration'])
+        ]
+
+    @classmethod
+    def get_batch_spent_calories(cls, columns: Columns,
+                                 speed: List[float]) -> List[float]:
+        """Калории при плавании для колонок тренировок."""
+        coef_1 = cls.COEF_CALL_1
+        coef_2 = cls.COEF_CALL_2
+        return [
+            (mean_speed + coef_1) * coef_2 * weight
+            for mean_speed, weight in zip(speed, columns['weight'])
+        ]
+
+
+@lru_cache(maxsize=None)
+def slot_values(training_class: Type[Training]) -> Callable[[Training], Any]:
+    """Функция, возвращающая значения слотов параметров тренировки."""
+    return attrgetter(*(name for owner in training_class.__mro__
+                        for name in getattr(owner, '__slots__', ())
+                        if name != '__dict__'))
+
+
+class CachedTraining:
+    """Тренировка с кэшем сообщения для частого опроса одного объекта.
+    Кэш сбрасывается, если изменились параметры или атрибуты экземпляра
+    тренировки, в том числе напрямую, а не через update. Изменения
+    констант класса не отслеживаются.
+    """
+
+    __slots__ = ('training', 'info', 'state')
+
+    def __init__(self, training: Training) -> None:
+        self.training = training
+        self.info: Optional[InfoMessage] = None
+        self.state: Optional[tuple] = None
+
+    def update(self, **values: Any) -> None:
+        """Изменить параметры или константы тренировки и сбросить кэш."""
+        for name, value in values.items():
+            setattr(self.training, name, value)
+        self.info = None
+
+    def snapshot(self) -> tuple:
+        """Вернуть значения параметров и атрибутов экземпляра."""
+        training = self.training
+        return (slot_values(type(training))(training),
+                tuple(vars(training).items()))
+
+    def show_training_info(self) -> InfoMessage:
+        """Вернуть сообщение, посчитав его только после изменений."""
+        state = self.snapshot()
+        if self.info is None or state != self.state:
+            self.info = self.training.show_training_info()
+            self.state = state
+        return self.info
+
 
 def read_package(workout_type: str, data: List[int]) -> Training:
     """Прочитать данные полученные от датчиков.
     Если нет типа тренировки, переданного в workout_type, возбудить исключение,
     Если есть вернуть экземпляр нужного класса.
     """
-    training_codes_and_classes_mapping: Dict[str, Type[Training]] = {
-        'SWM': Swimming,
-        'RUN': Running,
-        'WLK': SportsWalking
-    }
-    if workout_type in training_codes_and_classes_mapping:
-        return training_codes_and_classes_mapping[workout_type](*data)
+    try:
+        training_class, min_args, max_args = TRAINING_REGISTRY[workout_type]
+    except KeyError:
+        raise KeyError(
+            "Вид тренировки с ключем '%s' не зарегистрирован в программе."
+            % (workout_type)
+        ) from None
+    if not min_args <= len(data) <= max_args:
+        raise TypeError(
+            "Пакет '%s' должен содержать от %d до %d значений, получено %d."
+            % (workout_type, min_args, max_args, len(data)))
+    return training_class(*data)
+
+
+def calculate_batch(workout_type: str,
+                    columns: Columns) -> Dict[str, List[float]]:
+    """Рассчитать показатели для колонок тренировок одного вида.
+    columns содержит колонки параметров тренировки: action, duration,
+    weight и, в зависимости от вида, height или length_pool и count_pool.
+    """
+    if workout_type in TRAINING_CODES_AND_CLASSES:
+        return TRAINING_CODES_AND_CLASSES[workout_type].calculate_batch(
+            columns)
 
     raise KeyError(
         "Вид тренировки с ключем '%s' не зарегистрирован в программе."
@@ -164,19 +647,2546 @@ def read_package(workout_type: str, data: List[int]) -> Training:
     )
 
 
+KERNEL_STAGES: Tuple[str, ...] = (
+    'get_distance', 'get_mean_speed', 'get_spent_calories')
+KERNEL_METHODS: Tuple[str, ...] = KERNEL_STAGES + ('get_metrics',)
+KERNEL_SAMPLE: Dict[str, float] = {
+    'action': 9000, 'duration': 1.5, 'weight': 75, 'height': 180,
+    'length_pool': 25, 'count_pool': 40}
+Kernel = Callable[..., Tuple[float, float, float]]
+
+
+def kernel_key(training_class: Type[Training]) -> tuple:
+    """Вернуть константы и методы вместе с их кодом, от которых зависит
+    ядро.
+    """
+    key = []
+    for name in dir(training_class):
+        value = getattr(training_class, name)
+        if name in KERNEL_METHODS:
+            key.append((name, value, getattr(value, '__code__', None)))
+        elif name.isupper():
+            key.append((name, value))
+    return tuple(key)
+
+
+def get_kernel(training_class: Type[Training]) -> Kernel:
+    """Вернуть функцию расчета дистанции, скорости и калорий по параметрам.
+    Для классов с формулами это собранное ядро, иначе расчет через объект.
+    Ядро пересобирается, если у класса сменились константы или методы.
+    """
+    return build_kernel(training_class, kernel_key(training_class))
+
+
+@lru_cache(maxsize=None)
+def build_kernel(training_class: Type[Training], key: tuple) -> Kernel:
+    """Собрать ядро из формул методов класса, подставив значения констант.
+    Ядро строится, только если у всех методов этапов есть формулы,
+    get_metrics не переопределен и ядро совпадает с расчетом через объект
+    на всех пробных пакетах kernel_samples. Иначе возвращается расчет
+    через объект класса.
+    """
+    def fallback(*data: Any) -> Tuple[float, float, float]:
+        return training_class(*data).get_metrics()
+
+    expressions = [getattr(getattr(training_class, method), 'formula', None)
+                   for method in KERNEL_STAGES]
+    if None in expressions or next(
+            owner for owner in training_class.__mro__
+            if 'get_metrics' in vars(owner)) is not Training:
+        return fallback
+    expressions = [re.sub(
+        r'\b[A-Z][A-Z0-9_]*\b',
+        lambda match: '(%r)' % (getattr(training_class, match[0]),),
+        expression) for expression in expressions]
+    params = inspect.signature(training_class).parameters
+    kernel = eval('lambda %s: ((distance := %s), (speed := %s), %s)' % (
+        ', '.join(name if param.default is param.empty
+                  else '%s=%r' % (name, param.default)
+                  for name, param in params.items()),
+        *expressions), {'inf': math.inf, 'nan': math.nan})
+    try:
+        if all(kernel(*sample) == fallback(*sample)
+               for sample in kernel_samples(tuple(params))):
+            return kernel
+    except Exception:
+        pass
+    return fallback
+
+
+def kernel_samples(names: Tuple[str, ...]) -> Iterator[Tuple[float, ...]]:
+    """Пробные пакеты для проверки ядра: все сочетания типичного значения
+    KERNEL_SAMPLE и границ допустимого диапазона параметра из VALUE_RULES.
+    Крайние значения проводят расчет через все ветви формул, например
+    делают скорость ходьбы в квадрате больше роста.
+    """
+    choices = []
+    for name in names:
+        rules = VALUE_RULES.get(name, ())
+        candidates = [KERNEL_SAMPLE.get(name, 1)] + [
+            bound + 1 if comparison == '>' else bound
+            for comparison, bound in rules]
+        choices.append(sorted({
+            value for value in candidates
+            if all(COMPARISONS[comparison](value, bound)
+                   for comparison, bound in rules)}))
+    return product(*choices)
+
+
+def iter_kernel_records(packages: Iterable[Package]) -> Iterator[InfoRecord]:
+    """iter_records через ядра, ядро ищется один раз на вид тренировки."""
+    kernels: Dict[str, Tuple[str, Kernel]] = {}
+    for workout_type, data in packages:
+        if workout_type not in kernels:
+            if workout_type not in TRAINING_CODES_AND_CLASSES:
+                raise KeyError(
+                    "Вид тренировки с ключем '%s' не зарегистрирован "
+                    "в программе." % (workout_type))
+            training_class = TRAINING_CODES_AND_CLASSES[workout_type]
+            kernels[workout_type] = (training_class.__name__,
+                                     get_kernel(training_class))
+        training_type, kernel = kernels[workout_type]
+        yield InfoRecord(training_type, data[1], *kernel(*data))
+
+
+COEFFICIENTS: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+
+def register_coefficients(version: str,
+                          coefficients: Dict[str, Dict[str, float]]) -> None:
+    """Зарегистрировать версию констант формул.
+    coefficients задает для кода тренировки новые значения констант класса,
+    например {'RUN': {'COEF_CALL_1': 18.5}}. Не указанные константы
+    сохраняют значения класса.
+    """
+    if version in COEFFICIENTS:
+        raise ValueError(
+            "Версия коэффициентов '%s' уже зарегистрирована." % (version))
+    for workout_type, values in coefficients.items():
+        constants = get_coefficients(workout_type)
+        for name in values:
+            if name not in constants:
+                raise ValueError(
+                    "У вида тренировки '%s' нет константы '%s'."
+                    % (workout_type, name))
+    COEFFICIENTS[version] = {workout_type: dict(values) for workout_type,
+                             values in coefficients.items()}
+
+
+def get_coefficients(workout_type: str,
+                     version: Optional[str] = None) -> Dict[str, float]:
+    """Вернуть константы формул вида тренировки в заданной версии."""
+    training_class = versioned_class(
+        TRAINING_CODES_AND_CLASSES[workout_type], workout_type, version)
+    return {name: getattr(training_class, name)
+            for name in dir(training_class) if name.isupper()}
+
+
+@lru_cache(maxsize=None)
+def versioned_class(training_class: Type[Training], workout_type: str,
+                    version: Optional[str]) -> Type[Training]:
+    """Вернуть подкласс с константами версии или сам класс без версии.
+    Подкласс сохраняет имя класса, поэтому сообщения не меняются.
+    """
+    overrides = COEFFICIENTS[version].get(workout_type) if version else None
+    if not overrides:
+        return training_class
+    return type(training_class.__name__, (training_class,),
+                {'__slots__': (), '__module__': training_class.__module__,
+                 **overrides})
+
+
+def read_names(code: Any) -> frozenset:
+    """Собрать имена атрибутов, читаемых кодом функции и вложенным кодом."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= read_names(const)
+    return frozenset(names)
+
+
+def recalculate_batch(workout_type: str, columns: Columns,
+                      stored: Dict[str, Sequence[float]],
+                      old: Optional[str] = None,
+                      new: Optional[str] = None
+                      ) -> Dict[str, Sequence[float]]:
+    """Пересчитать показатели при смене версии констант.
+    stored содержит рассчитанные в версии old колонки distance, speed и
+    calories. Этап пересчитывается, только если его пакетный метод читает
+    измененную константу или изменился предыдущий этап, остальные колонки
+    возвращаются как есть.
+    """
+    training_class = TRAINING_CODES_AND_CLASSES[workout_type]
+    old_values = get_coefficients(workout_type, old)
+    new_values = get_coefficients(workout_type, new)
+    changed = {name for name, value in new_values.items()
+               if old_values[name] != value}
+    target = versioned_class(training_class, workout_type, new)
+    result = dict(stored)
+    stale = False
+    for stage, method, argument in (
+            ('distance', target.get_batch_distance, None),
+            ('speed', target.get_batch_mean_speed, 'distance'),
+            ('calories', target.get_batch_spent_calories, 'speed')):
+        stale = stale or bool(changed & read_names(method.__code__))
+        if stale:
+            result[stage] = (method(columns) if argument is None
+                             else method(columns, result[argument]))
+    return result
+
+
+VALUE_RULES: Dict[str, Tuple[Tuple[str, float], ...]] = {
+    'action': (('>=', 0), ('<=', 1e8)),
+    'duration': (('>', 0), ('>=', 1e-6), ('<=', 1e4)),
+    'weight': (('>', 0), ('<=', 1e4)),
+    'height': (('>', 0), ('<=', 1e4)),
+    'length_pool': (('>', 0), ('<=', 1e4)),
+    'count_pool': (('>=', 0), ('<=', 1e6)),
+}
+COMPARISONS: Dict[str, Callable[[Any, Any], bool]] = {
+    '>': gt,
+    '>=': ge,
+    '<=': le,
+}
+
+
+def build_validator(
+        workout_type: str) -> Callable[[Sequence[Any]], Optional[str]]:
+    """Собрать проверку пакета для зарегистрированного вида тренировки.
+    Условия VALUE_RULES для обязательных параметров компилируются в одно
+    выражение. Причина отказа ищется только для пакета, не прошедшего его.
+    Верхние границы отсекают inf и nan, а вместе с нижней границей
+    длительности не дают расчету переполниться.
+    """
+    training_class, min_args, max_args = TRAINING_REGISTRY[workout_type]
+    names = list(inspect.signature(training_class).parameters)[:min_args]
+    conditions = ' and '.join(
+        'data[%d] %s %r' % ((index,) + rule)
+        for index, name in enumerate(names)
+        for rule in VALUE_RULES.get(name, ()))
+    check = eval('lambda data: %s' % (conditions or 'True'))
+
+    def validate(data: Sequence[Any]) -> Optional[str]:
+        if not isinstance(data, (list, tuple)):
+            return 'данные пакета должны быть списком'
+        if not min_args <= len(data) <= max_args:
+            return 'ожидается от %d до %d значений' % (min_args, max_args)
+        try:
+            if check(data):
+                return None
+        except TypeError:
+            pass
+        return explain_rejection(names, data)
+
+    return validate
+
+
+def explain_rejection(names: List[str], data: Sequence[Any]) -> str:
+    """Найти первый параметр пакета, нарушающий VALUE_RULES."""
+    for name, value in zip(names, data):
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            return '%s: не число' % name
+        for comparison, bound in VALUE_RULES.get(name, ()):
+            if not COMPARISONS[comparison](value, bound):
+                return '%s: должно быть %s %r' % (name, comparison, bound)
+    return 'некорректный пакет'
+
+
+def validate_package(workout_type: str,
+                     data: Sequence[Any]) -> Optional[str]:
+    """Проверить пакет. Вернуть причину отказа или None для верного."""
+    if not isinstance(workout_type, str):
+        return 'неизвестный вид тренировки'
+    try:
+        return VALIDATORS[workout_type](data)
+    except KeyError:
+        if workout_type not in TRAINING_REGISTRY:
+            return 'неизвестный вид тренировки'
+        VALIDATORS[workout_type] = build_validator(workout_type)
+        return VALIDATORS[workout_type](data)
+
+
+class RejectSink:
+    """Приемник отклоненных пакетов.
+    Считает отказы по причинам и, если задан stream, пишет каждый отказ
+    JSON-строкой с исходным пакетом и причиной.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = stream
+        self.counts: Dict[str, int] = {}
+
+    def __call__(self, package: Any, reason: str) -> None:
+        self.counts[reason] = self.counts.get(reason, 0) + 1
+        if self.stream is not None:
+            self.stream.write(json.dumps(
+                {'package': package, 'reason': reason},
+                ensure_ascii=False) + '\n')
+
+    @property
+    def total(self) -> int:
+        """Общее количество отклоненных пакетов."""
+        return sum(self.counts.values())
+
+
+def filter_valid(packages: Iterable[Package],
+                 reject: Callable[[Any, str], None]) -> Iterator[Package]:
+    """Пропустить верные пакеты, отклоненные передать в reject."""
+    validators = VALIDATORS
+    for package in packages:
+        workout_type, data = package
+        try:
+            reason = validators[workout_type](data)
+        except (KeyError, TypeError):
+            reason = validate_package(workout_type, data)
+        if reason is None:
+            yield package
+        else:
+            reject(package, reason)
+
+
+CacheKey = Tuple[str, tuple, tuple]
+
+
+class PackageCache:
+    """LRU-кэш сообщений по содержимому пакета.
+    Ключ — (workout_type, tuple(data), типы значений data): пакеты с 1 и
+    1.0 дают разный текст csv, поэтому кэшируются отдельно. Одинаковые
+    пакеты получают один и тот же объект InfoMessage, поэтому изменять его
+    нельзя. После изменения констант тренировок кэш нужно очистить.
+    """
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.capacity = capacity
+        self.entries: 'OrderedDict[CacheKey, InfoMessage]' = (
+            OrderedDict())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(workout_type: str, data: Sequence[Any]) -> CacheKey:
+        """Ключ кэша для пакета."""
+        return workout_type, tuple(data), tuple(map(type, data))
+
+    def get_info(self, workout_type: str, data: Sequence[Any]) -> InfoMessage:
+        """Получить сообщение для пакета из кэша или рассчитать его."""
+        key = self.key(workout_type, data)
+        info = self.entries.get(key)
+        if info is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return info
+        info = read_package(workout_type, list(data)).show_training_info()
+        self.store(key, info)
+        return info
+
+    def lookup(self, key: CacheKey) -> Optional[InfoMessage]:
+        """Вернуть сообщение по ключу или None, учитывая попадание."""
+        info = self.entries.get(key)
+        if info is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return info
+
+    def store(self, key: CacheKey, info: InfoMessage) -> None:
+        """Сохранить сообщение, вытеснив самое старое при переполнении."""
+        self.misses += 1
+        self.entries[key] = info
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Вернуть счетчики попаданий, промахов и вытеснений."""
+        return {'size': len(self.entries), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def clear(self) -> None:
+        """Очистить кэш, сохранив счетчики."""
+        self.entries.clear()
+
+
+class ThreadSafePackageCache(PackageCache):
+    """PackageCache для использования из нескольких потоков.
+    Расчет промаха выполняется вне блокировки.
+    """
+
+    def __init__(self, capacity: int = 4096) -> None:
+        super().__init__(capacity)
+        self.lock = threading.Lock()
+
+    def get_info(self, workout_type: str, data: Sequence[Any]) -> InfoMessage:
+        key = self.key(workout_type, data)
+        info = self.lookup(key)
+        if info is None:
+            info = read_package(workout_type, list(data)).show_training_info()
+            self.store(key, info)
+        return info
+
+    def lookup(self, key: CacheKey) -> Optional[InfoMessage]:
+        with self.lock:
+            return super().lookup(key)
+
+    def store(self, key: CacheKey, info: InfoMessage) -> None:
+        with self.lock:
+            super().store(key, info)
+
+    def clear(self) -> None:
+        with self.lock:
+            super().clear()
+
+
+class QuantileSketch:
+    """Приближенные квантили с заданной относительной точностью.
+    Значения раскладываются по логарифмическим корзинам, поэтому память
+    не зависит от количества значений, а эскизы можно объединять.
+    """
+
+    __slots__ = ('gamma', 'log_gamma', 'positive', 'negative', 'zero',
+                 'count')
+
+    def __init__(self, accuracy: float = 0.01) -> None:
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        """Добавить значение. Бесконечности и NaN пропускаются."""
+        if value > 0 and value != math.inf:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < 0 and value != -math.inf:
+            key = math.ceil(math.log(-value) / self.log_gamma)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        elif value == 0:
+            self.zero += 1
+        else:
+            return
+        self.count += 1
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        """Добавить значения другого эскиза с той же точностью."""
+        for buckets, other_buckets in ((self.positive, other.positive),
+                                       (self.negative, other.negative)):
+            for key, count in other_buckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """Получить q-квантиль, 0 <= q <= 1."""
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        buckets = [(-self.bucket_value(key), count) for key, count
+                   in sorted(self.negative.items(), reverse=True)]
+        buckets.append((0.0, self.zero))
+        buckets.extend((self.bucket_value(key), count) for key, count
+                       in sorted(self.positive.items()))
+        for value, count in buckets:
+            seen += count
+            if seen > rank:
+                return value
+        return buckets[-1][0]
+
+    def bucket_value(self, key: int) -> float:
+        """Оценка модуля значений корзины key."""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Вернуть состояние эскиза для сохранения в JSON."""
+        return {'accuracy': (self.gamma - 1) / (self.gamma + 1),
+                'positive': sorted(self.positive.items()),
+                'negative': sorted(self.negative.items()),
+                'zero': self.zero}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'QuantileSketch':
+        """Восстановить эскиз из результата to_dict."""
+        sketch = cls(state['accuracy'])
+        sketch.positive = {key: count for key, count in state['positive']}
+        sketch.negative = {key: count for key, count in state['negative']}
+        sketch.zero = state['zero']
+        sketch.count = (sketch.zero + sum(sketch.positive.values())
+                        + sum(sketch.negative.values()))
+        return sketch
+
+
+class MetricStats:
+    """Накопительная статистика одного показателя."""
+
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'sketch')
+
+    def __init__(self, accuracy: float = 0.01) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.sketch = QuantileSketch(accuracy)
+
+    def add(self, value: float) -> None:
+        """Учесть значение показателя."""
+        self.count += 1
+        self.total += value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        self.sketch.add(value)
+
+    def merge(self, other: 'MetricStats') -> None:
+        """Добавить статистику, собранную в другом месте."""
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.sketch.merge(other.sketch)
+
+    def summary(self) -> Dict[str, float]:
+        """Вернуть сводку: количество, сумма, среднее, min/max, квантили."""
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else math.nan,
+            'min': self.minimum,
+            'max': self.maximum,
+            'p50': self.sketch.quantile(0.5),
+            'p90': self.sketch.quantile(0.9),
+            'p99': self.sketch.quantile(0.99),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Вернуть состояние статистики для сохранения в JSON."""
+        return {'count': self.count, 'sum': self.total,
+                'min': self.minimum, 'max': self.maximum,
+                'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'MetricStats':
+        """Восстановить статистику из результата to_dict."""
+        stats = cls()
+        stats.count = state['count']
+        stats.total = state['sum']
+        stats.minimum = state['min']
+        stats.maximum = state['max']
+        stats.sketch = QuantileSketch.from_dict(state['sketch'])
+        return stats
+
+
+class TrainingAggregator:
+    """Потоковая агрегация показателей по видам тренировок.
+    Статистика ведется по ключу (training_type, group), где group —
+    произвольная метка: спортсмен, временное окно и т.п.
+    """
+
+    METRICS: ClassVar[Tuple[str, ...]] = INFO_FIELDS[1:]
+
+    def __init__(self, accuracy: float = 0.01) -> None:
+        self.accuracy = accuracy
+        self.groups: Dict[Tuple[str, Hashable], Dict[str, MetricStats]] = {}
+
+    def get_group(self, training_type: str,
+                  group: Hashable = None) -> Dict[str, MetricStats]:
+        """Получить статистику группы, создав ее при необходимости."""
+        key = (training_type, group)
+        if key not in self.groups:
+            self.groups[key] = {metric: MetricStats(self.accuracy)
+                                for metric in self.METRICS}
+        return self.groups[key]
+
+    def add_message(self, info: InfoMessage, group: Hashable = None) -> None:
+        """Учесть информационное сообщение о тренировке."""
+        stats = self.get_group(info.training_type, group)
+        stats['duration'].add(info.duration)
+        stats['distance'].add(info.distance)
+        stats['speed'].add(info.speed)
+        stats['calories'].add(info.calories)
+
+    def add(self, training: Training, group: Hashable = None) -> None:
+        """Учесть тренировку."""
+        self.add_message(training.show_training_info(), group)
+
+    def add_batch(self, training_type: str,
+                  metrics: Dict[str, Sequence[float]],
+                  group: Hashable = None) -> None:
+        """Учесть колонки показателей, например результат calculate_batch
+        с добавленной колонкой duration.
+        """
+        stats = self.get_group(training_type, group)
+        for metric in self.METRICS:
+            add = stats[metric].add
+            for value in metrics[metric]:
+                add(value)
+
+    def merge(self, other: 'TrainingAggregator') -> None:
+        """Объединить с частичной агрегацией другого обработчика."""
+        for key, other_stats in other.groups.items():
+            stats = self.get_group(*key)
+            for metric in self.METRICS:
+                stats[metric].merge(other_stats[metric])
+
+    def summary(self) -> Dict[Tuple[str, Hashable],
+                              Dict[str, Dict[str, float]]]:
+        """Вернуть сводку по всем группам."""
+        return {key: {metric: metric_stats.summary()
+                      for metric, metric_stats in stats.items()}
+                for key, stats in self.groups.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Вернуть состояние для сохранения в JSON.
+        Метки групп должны быть строками, числами или None.
+        """
+        return {'accuracy': self.accuracy,
+                'groups': [[training_type, group,
+                            {metric: metric_stats.to_dict()
+                             for metric, metric_stats in stats.items()}]
+                           for (training_type, group), stats
+                           in self.groups.items()]}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'TrainingAggregator':
+        """Восстановить агрегацию из результата to_dict."""
+        aggregator = cls(state['accuracy'])
+        for training_type, group, stats in state['groups']:
+            aggregator.groups[training_type, group] = {
+                metric: MetricStats.from_dict(metric_stats)
+                for metric, metric_stats in stats.items()}
+        return aggregator
+
+
+class TrainingSession:
+    """Тренировка, собираемая из потока замеров датчика.
+    Замер содержит время в секундах и приращения счетчиков: шагов или
+    гребков (action) и, для плавания, пройденных бассейнов (count_pool).
+    Хранятся только суммы с начала тренировки и с начала текущего отрезка,
+    поэтому замер обрабатывается за O(1) независимо от длины тренировки.
+    Отрезок закрывается на замере, на котором дистанция тренировки
+    достигла следующих split_km километров или прошло split_seconds
+    секунд с начала отрезка.
+    """
+
+    SECONDS_IN_HOUR: ClassVar[int] = 3600
+    COUNTERS: ClassVar[Tuple[str, ...]] = ('action', 'count_pool')
+
+    def __init__(self, workout_type: str, start: float,
+                 split_km: Optional[float] = None,
+                 split_seconds: Optional[float] = None,
+                 **params: float) -> None:
+        self.workout_type = workout_type
+        self.names = list(inspect.signature(
+            TRAINING_CODES_AND_CLASSES[workout_type]).parameters)
+        self.params = params
+        self.start = self.last = self.split_start = start
+        self.split_km = split_km
+        self.split_seconds = split_seconds
+        self.next_km = split_km
+        self.counters = [name for name in self.COUNTERS if name in self.names]
+        self.totals = dict.fromkeys(self.counters, 0)
+        self.split_totals = dict.fromkeys(self.counters, 0)
+        self.training = self.build(self.totals, 0.0)
+
+    def build(self, counters: Dict[str, float], seconds: float) -> Training:
+        """Создать тренировку по счетчикам и длительности в секундах."""
+        values = dict(self.params, duration=seconds / self.SECONDS_IN_HOUR,
+                      **counters)
+        return read_package(self.workout_type,
+                            [values[name] for name in self.names])
+
+    def add(self, timestamp: float, action: float = 0,
+            **counters: float) -> Optional[InfoMessage]:
+        """Учесть замер. Вернуть сообщение об отрезке, если он закрыт."""
+        if timestamp < self.last:
+            raise ValueError(
+                'Замер %r раньше предыдущего %r.' % (timestamp, self.last))
+        self.last = timestamp
+        counters['action'] = action
+        for name in self.counters:
+            value = counters.get(name, 0)
+            self.totals[name] += value
+            self.split_totals[name] += value
+        training = self.training
+        for name in self.counters:
+            setattr(training, name, self.totals[name])
+        training.duration = (timestamp - self.start) / self.SECONDS_IN_HOUR
+        if self.next_km is not None and (
+                training.get_distance() >= self.next_km):
+            while self.next_km <= training.get_distance():
+                self.next_km += self.split_km
+            return self.close_split()
+        if self.split_seconds is not None and (
+                timestamp - self.split_start >= self.split_seconds):
+            return self.close_split()
+        return None
+
+    def close_split(self) -> Optional[InfoMessage]:
+        """Закрыть текущий отрезок и вернуть сообщение о нем."""
+        seconds = self.last - self.split_start
+        if seconds <= 0:
+            return None
+        info = self.build(self.split_totals, seconds).show_training_info()
+        self.split_start = self.last
+        self.split_totals = dict.fromkeys(self.counters, 0)
+        return info
+
+    def finish(self) -> Optional[InfoMessage]:
+        """Закрыть последний неполный отрезок, если после начала отрезка
+        прошло время. Отрезок без шагов, например отдых, тоже выдается.
+        """
+        return self.close_split()
+
+    def show_training_info(self) -> InfoMessage:
+        """Вернуть сообщение о тренировке с начала до последнего замера.
+        Пока время не прошло, скорость и калории равны нулю.
+        """
+        training = self.training
+        if self.last <= self.start:
+            return InfoMessage(training.__class__.__name__, 0.0,
+                               training.get_distance(), 0.0, 0.0)
+        return training.show_training_info()
+
+
+def iter_splits(session: TrainingSession,
+                samples: Iterable[Tuple[float, ...]]) -> Iterator[InfoMessage]:
+    """Лениво выдавать отрезки по замерам (время, action[, count_pool]).
+    После последнего замера выдается неполный отрезок.
+    """
+    for timestamp, *counters in samples:
+        info = session.add(timestamp, **dict(zip(session.counters, counters)))
+        if info is not None:
+            yield info
+    info = session.finish()
+    if info is not None:
+        yield info
+
+
+class Instrumentation:
+    """Счетчики пакетов и гистограммы задержек по стадиям обработки.
+    Статистика ведется по ключу (стадия, вид тренировки). Для стадий,
+    которые обрабатывают пачку сообщений, вид тренировки — 'all'.
+    Учет защищен блокировкой, поэтому стадии могут работать в потоках.
+    """
+
+    STAGES: ClassVar[Tuple[str, ...]] = (
+        'parse', 'cache', 'dispatch', 'compute', 'format', 'write')
+    BUCKETS: ClassVar[Tuple[float, ...]] = (
+        1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+    def __init__(self) -> None:
+        self.packages: Dict[Tuple[str, str], int] = {}
+        self.seconds: Dict[Tuple[str, str], float] = {}
+        self.histograms: Dict[Tuple[str, str], List[int]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, training_type: str, seconds: float,
+                packages: int = 1) -> None:
+        """Учесть один вызов стадии, обработавший packages пакетов."""
+        key = (stage, training_type)
+        bucket = bisect.bisect_left(self.BUCKETS, seconds)
+        with self.lock:
+            if key not in self.histograms:
+                self.packages[key] = 0
+                self.seconds[key] = 0.0
+                self.histograms[key] = [0] * (len(self.BUCKETS) + 1)
+            self.packages[key] += packages
+            self.seconds[key] += seconds
+            self.histograms[key][bucket] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Вернуть статистику в виде, пригодном для JSON."""
+        return {
+            'buckets': list(self.BUCKETS),
+            'stages': [
+                {'stage': key[0], 'training_type': key[1],
+                 'packages': self.packages[key],
+                 'seconds': self.seconds[key],
+                 'histogram': self.histograms[key]}
+                for key in sorted(self.histograms)
+            ],
+        }
+
+    @staticmethod
+    def escape_label(value: str) -> str:
+        """Экранировать значение метки по правилам формата Prometheus."""
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+            '\n', '\\n')
+
+    def to_prometheus(self) -> str:
+        """Вернуть статистику в текстовом формате Prometheus."""
+        keys = sorted(self.histograms)
+        bounds = [repr(bound) for bound in self.BUCKETS] + ['+Inf']
+        labels = {key: 'stage="%s",training_type="%s"'
+                  % tuple(map(self.escape_label, key)) for key in keys}
+        lines = ['# TYPE homework_stage_packages_total counter']
+        lines.extend('homework_stage_packages_total{%s} %d'
+                     % (labels[key], self.packages[key]) for key in keys)
+        lines.append('# TYPE homework_stage_seconds histogram')
+        for key in keys:
+            cumulative = 0
+            for bound, count in zip(bounds, self.histograms[key]):
+                cumulative += count
+                lines.append('homework_stage_seconds_bucket{%s,le="%s"} %d'
+                             % (labels[key], bound, cumulative))
+            lines.append('homework_stage_seconds_sum{%s} %r'
+                         % (labels[key], self.seconds[key]))
+            lines.append('homework_stage_seconds_count{%s} %d'
+                         % (labels[key], cumulative))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str) -> None:
+        """Сохранить статистику в файл: .json — JSON, иначе Prometheus."""
+        with open(path, 'w', encoding='utf-8') as dst:
+            if path.endswith('.json'):
+                json.dump(self.to_dict(), dst, ensure_ascii=False, indent=2)
+            else:
+                dst.write(self.to_prometheus())
+
+
+INSTRUMENTATION: Optional[Instrumentation] = None
+
+
+def enable_instrumentation() -> Instrumentation:
+    """Включить сбор статистики по стадиям и вернуть ее хранилище."""
+    global INSTRUMENTATION
+    INSTRUMENTATION = Instrumentation()
+    return INSTRUMENTATION
+
+
+def disable_instrumentation() -> None:
+    """Выключить сбор статистики."""
+    global INSTRUMENTATION
+    INSTRUMENTATION = None
+
+
 def main(training: Training) -> None:
     """Главная функция."""
+    if INSTRUMENTATION is not None:
+        return main_instrumented(training, INSTRUMENTATION)
     info: InfoMessage = training.show_training_info()
     print(info.get_message())
 
 
-if __name__ == '__main__':
-    packages = [
-        ('SWM', [720, 1, 80, 25, 40]),
-        ('RUN', [15000, 1, 75]),
-        ('WLK', [9000, 1, 75, 180]),
-    ]
+def main_instrumented(training: Training,
+                      instrumentation: Instrumentation) -> None:
+    """main с замером стадий расчета, форматирования и вывода."""
+    training_type = training.__class__.__name__
+    start = time.perf_counter()
+    info: InfoMessage = training.show_training_info()
+    computed = time.perf_counter()
+    message = info.get_message()
+    formatted = time.perf_counter()
+    print(message)
+    written = time.perf_counter()
+    instrumentation.observe('compute', training_type, computed - start)
+    instrumentation.observe('format', training_type, formatted - computed)
+    instrumentation.observe('write', training_type, written - formatted)
+
 
+def parse_number(value: str) -> float:
+    """Преобразовать строковое значение датчика в число."""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_package(line: str) -> Package:
+    """Разобрать строку пакета.
+    Поддерживаются форматы `CODE,v1,v2,...`, JSON-список
+    `["CODE", [v1, v2, ...]]` и JSON-объект с ключами workout_type и data.
+    """
+    line = line.strip()
+    if line.startswith(('[', '{')):
+        package = json.loads(line)
+        if isinstance(package, dict):
+            if 'workout_type' not in package or 'data' not in package:
+                raise ValueError(
+                    'В пакете должны быть ключи workout_type и data.')
+            return package['workout_type'], package['data']
+        workout_type, data = package
+        return workout_type, data
+    workout_type, *values = line.split(',')
+    return workout_type.strip(), [parse_number(value) for value in values]
+
+
+def iter_packages(
+        stream: TextIO, chunk_size: int = CHUNK_SIZE,
+        reject: Optional[Callable[[Any, str], None]] = None
+) -> Iterator[Package]:
+    """Лениво читать пакеты из потока порциями примерно по chunk_size байт.
+    Пустые строки пропускаются. Если задан reject, неразобранные строки
+    передаются в него, иначе ошибка разбора прерывает чтение.
+    """
+    instrumentation = INSTRUMENTATION
+    while True:
+        lines = stream.readlines(chunk_size)
+        if not lines:
+            return
+        if reject is not None:
+            yield from parse_or_reject(lines, reject, instrumentation)
+            continue
+        if instrumentation is not None:
+            yield from parse_instrumented(lines, instrumentation)
+            continue
+        for line in lines:
+            if line.strip():
+                yield parse_package(line)
+
+
+def parse_or_reject(
+        lines: List[str], reject: Callable[[Any, str], None],
+        instrumentation: Optional[Instrumentation] = None
+) -> Iterator[Package]:
+    """Разбор строк с передачей неразобранных в reject.
+    Если instrumentation задан, разобранные строки учитываются в стадии
+    parse.
+    """
+    for line in lines:
+        if line.strip():
+            try:
+                if instrumentation is None:
+                    package = parse_package(line)
+                else:
+                    package = parse_measured(line, instrumentation)
+            except (ValueError, TypeError) as error:
+                reject(line.rstrip('\n'), 'не удалось разобрать: %s'
+                       % type(error).__name__)
+                continue
+            yield package
+
+
+def parse_instrumented(lines: List[str],
+                       instrumentation: Instrumentation) -> Iterator[Package]:
+    """Разбор строк с замером стадии parse."""
+    for line in lines:
+        if line.strip():
+            yield parse_measured(line, instrumentation)
+
+
+def parse_measured(line: str, instrumentation: Instrumentation) -> Package:
+    """Разобрать строку пакета и учесть время в стадии parse.
+    Пакеты с незарегистрированным кодом учитываются под видом unknown,
+    чтобы случайные коды не порождали новые ряды статистики.
+    """
+    start = time.perf_counter()
+    package = parse_package(line)
+    workout_type = package[0]
+    training_class = (TRAINING_CODES_AND_CLASSES.get(workout_type)
+                      if isinstance(workout_type, str) else None)
+    instrumentation.observe(
+        'parse', training_class.__name__ if training_class else 'unknown',
+        time.perf_counter() - start)
+    return package
+
+
+def iter_messages(
+        packages: Iterable[Package],
+        cache: Optional[PackageCache] = None) -> Iterator[InfoMessage]:
+    """Лениво превращать пакеты в информационные сообщения.
+    Если задан cache, повторяющиеся пакеты берутся из него.
+    """
+    instrumentation = INSTRUMENTATION
+    if cache is not None:
+        if instrumentation is not None:
+            yield from map(cached_instrumented(cache, instrumentation),
+                           packages)
+        else:
+            yield from starmap(cache.get_info, packages)
+        return
+    if instrumentation is not None:
+        yield from messages_instrumented(packages, instrumentation)
+        return
     for workout_type, data in packages:
+        yield read_package(workout_type, data).show_training_info()
+
+
+def iter_records(packages: Iterable[Package],
+                 kernels: bool = False) -> Iterator[InfoRecord]:
+    """Лениво превращать пакеты в записи InfoRecord без текста.
+    При kernels=True расчет идет через ядра без создания объектов.
+    """
+    if kernels:
+        yield from iter_kernel_records(packages)
+        return
+    for workout_type, data in packages:
+        yield read_package(workout_type, data).show_training_record()
+
+
+def collect_columns(packages: Iterable[Package], size: int = 0,
+                    kernels: bool = False) -> InfoColumns:
+    """Рассчитать пакеты и собрать поля сообщений в колонки.
+    size задает ожидаемое количество пакетов для выделения памяти заранее.
+    """
+    columns = InfoColumns(size)
+    append = columns.append
+    if kernels:
+        for record in iter_kernel_records(packages):
+            append(*record)
+        return columns
+    for workout_type, data in packages:
+        append(*read_package(workout_type, data).show_training_record())
+    return columns
+
+
+def messages_instrumented(
+        packages: Iterable[Package],
+        instrumentation: Instrumentation) -> Iterator[InfoMessage]:
+    """iter_messages с замером стадий dispatch и compute."""
+    for workout_type, data in packages:
+        start = time.perf_counter()
         training = read_package(workout_type, data)
-        main(training)
+        dispatched = time.perf_counter()
+        info = training.show_training_info()
+        computed = time.perf_counter()
+        instrumentation.observe('dispatch', info.training_type,
+                                dispatched - start)
+        instrumentation.observe('compute', info.training_type,
+                                computed - dispatched)
+        yield info
+
+
+def cached_instrumented(
+        cache: PackageCache, instrumentation: Instrumentation
+) -> Callable[[Package], InfoMessage]:
+    """cache.get_info для пакета с замером стадий.
+    Попадания учитываются в стадии cache, промахи — в dispatch и compute.
+    """
+    def get_info(package: Package) -> InfoMessage:
+        workout_type, data = package
+        start = time.perf_counter()
+        key = cache.key(workout_type, data)
+        info = cache.lookup(key)
+        if info is not None:
+            instrumentation.observe('cache', info.training_type,
+                                    time.perf_counter() - start)
+            return info
+        training = read_package(workout_type, list(data))
+        dispatched = time.perf_counter()
+        info = training.show_training_info()
+        computed = time.perf_counter()
+        cache.store(key, info)
+        instrumentation.observe('dispatch', info.training_type,
+                                dispatched - start)
+        instrumentation.observe('compute', info.training_type,
+                                computed - dispatched)
+        return info
+    return get_info
+
+
+def write_messages(messages: Iterable[InfoMessage], stream: TextIO,
+                   buffer_size: int = BUFFER_SIZE,
+                   output_format: str = 'text') -> int:
+    """Записать сообщения в поток блоками по buffer_size сообщений.
+    output_format — ключ OUTPUT_FORMATS. Возвращает количество записанных
+    сообщений.
+    """
+    flush = flush_instrumented(stream, INSTRUMENTATION,
+                               OUTPUT_FORMATS[output_format])
+    buffer: List[InfoMessage] = []
+    count = 0
+    for info in messages:
+        buffer.append(info)
+        if len(buffer) >= buffer_size:
+            flush(buffer)
+            count += len(buffer)
+            buffer.clear()
+    if buffer:
+        flush(buffer)
+        count += len(buffer)
+    return count
+
+
+def flush_instrumented(
+    stream: TextIO, instrumentation: Optional[Instrumentation],
+    render: Callable[[List[InfoMessage]], str] = format_many
+) -> Callable[[List[InfoMessage]], None]:
+    """Функция вывода пачки сообщений в поток через render.
+    Если instrumentation задан, замеряются стадии format и write.
+    """
+    if instrumentation is None:
+        def flush(buffer: List[InfoMessage]) -> None:
+            stream.write(render(buffer))
+        return flush
+
+    def flush_measured(buffer: List[InfoMessage]) -> None:
+        start = time.perf_counter()
+        text = render(buffer)
+        formatted = time.perf_counter()
+        stream.write(text)
+        written = time.perf_counter()
+        instrumentation.observe('format', 'all', formatted - start,
+                                len(buffer))
+        instrumentation.observe('write', 'all', written - formatted,
+                                len(buffer))
+    return flush_measured
+
+
+def process_packages(
+        packages: Iterable[Package], dst: TextIO,
+        buffer_size: int = BUFFER_SIZE,
+        reject: Optional[Callable[[Any, str], None]] = None,
+        cache: Optional[PackageCache] = None,
+        output_format: str = 'text', header: bool = True) -> int:
+    """Обработать пакеты и записать результат с постоянной памятью.
+    Если задан reject, некорректные пакеты передаются в него и не
+    прерывают обработку. Если задан cache, повторы берутся из него.
+    header=False отключает заголовок формата, например для частей файла.
+    """
+    if reject is not None:
+        packages = filter_valid(packages, reject)
+    if header and output_format in OUTPUT_HEADERS:
+        dst.write(OUTPUT_HEADERS[output_format])
+    return write_messages(iter_messages(packages, cache), dst, buffer_size,
+                          output_format)
+
+
+def process_stream(
+        src: TextIO, dst: TextIO, chunk_size: int = CHUNK_SIZE,
+        buffer_size: int = BUFFER_SIZE,
+        reject: Optional[Callable[[Any, str], None]] = None,
+        cache: Optional[PackageCache] = None,
+        output_format: str = 'text', header: bool = True) -> int:
+    """Обработать текстовый поток пакетов, см. process_packages."""
+    return process_packages(iter_packages(src, chunk_size, reject), dst,
+                            buffer_size, reject, cache, output_format, header)
+
+
+PIPELINE_STOP = object()
+
+
+class ThreadPipeline:
+    """Конвейер чтение -> read_package -> show_training_info -> запись.
+    Стадии работают в потоках и связаны очередями ограниченного размера,
+    поэтому медленный источник не останавливает расчет, а быстрый не
+    переполняет память. Сообщения выводятся в порядке пакетов. Первая
+    ошибка любой стадии останавливает чтение и возбуждается в run().
+    При включенном сборе статистики стадии замеряются как в
+    process_packages. Если задан cache, потоки расчета берут повторы из
+    него, а стадия read_package не нужна.
+    """
+
+    def __init__(self, dispatch_threads: int = 1, compute_threads: int = 1,
+                 queue_size: int = BUFFER_SIZE,
+                 buffer_size: int = BUFFER_SIZE,
+                 output_format: str = 'text',
+                 cache: Optional[ThreadSafePackageCache] = None) -> None:
+        self.dispatch_threads = dispatch_threads
+        self.compute_threads = compute_threads
+        self.queue_size = queue_size
+        self.buffer_size = buffer_size
+        self.output_format = output_format
+        self.cache = cache
+        self.failed = threading.Event()
+        self.errors: List[BaseException] = []
+
+    def fail(self, error: BaseException) -> None:
+        """Запомнить ошибку и остановить конвейер."""
+        self.errors.append(error)
+        self.failed.set()
+
+    def read(self, packages: Iterable[Package], target: queue.Queue,
+             consumers: int) -> None:
+        """Стадия чтения: пронумеровать пакеты источника."""
+        try:
+            for item in enumerate(packages):
+                if self.failed.is_set():
+                    break
+                target.put(item)
+        except Exception as error:
+            self.fail(error)
+        for _ in range(consumers):
+            target.put(PIPELINE_STOP)
+
+    def start_stage(self, func: Callable[[Any], Any], threads: int,
+                    source: queue.Queue, target: queue.Queue,
+                    consumers: int) -> List[threading.Thread]:
+        """Запустить threads потоков, применяющих func к элементам source.
+        Последний завершившийся поток передает стоп каждому из consumers.
+        """
+        remaining = [threads]
+        lock = threading.Lock()
+
+        def work() -> None:
+            for seq, value in iter(source.get, PIPELINE_STOP):
+                if self.failed.is_set():
+                    continue
+                try:
+                    target.put((seq, func(value)))
+                except Exception as error:
+                    self.fail(error)
+            with lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last:
+                for _ in range(consumers):
+                    target.put(PIPELINE_STOP)
+
+        workers = [threading.Thread(target=work, daemon=True)
+                   for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        return workers
+
+    def write(self, source: queue.Queue, dst: TextIO) -> int:
+        """Стадия записи: восстановить порядок и писать пачками."""
+        pending: Dict[int, InfoMessage] = {}
+        buffer: List[InfoMessage] = []
+        count = 0
+        for seq, info in iter(source.get, PIPELINE_STOP):
+            if self.failed.is_set():
+                continue
+            pending[seq] = info
+            while count + len(buffer) in pending:
+                buffer.append(pending.pop(count + len(buffer)))
+            if len(buffer) >= self.buffer_size:
+                count += self.flush(buffer, dst)
+        return count + self.flush(buffer, dst)
+
+    def flush(self, buffer: List[InfoMessage], dst: TextIO) -> int:
+        """Записать пачку сообщений и вернуть их количество."""
+        if buffer and not self.failed.is_set():
+            try:
+                flush_instrumented(dst, INSTRUMENTATION,
+                                   OUTPUT_FORMATS[self.output_format])(buffer)
+            except Exception as error:
+                self.fail(error)
+        count = len(buffer)
+        buffer.clear()
+        return count
+
+    @staticmethod
+    def measure(stage: str, func: Callable[[Any], Any],
+                training_type: Callable[[Any], str]) -> Callable[[Any], Any]:
+        """Обернуть функцию стадии замером времени, если сбор статистики
+        включен. training_type получает вид тренировки из результата.
+        """
+        instrumentation = INSTRUMENTATION
+        if instrumentation is None:
+            return func
+
+        def measured(value: Any) -> Any:
+            start = time.perf_counter()
+            result = func(value)
+            instrumentation.observe(stage, training_type(result),
+                                    time.perf_counter() - start)
+            return result
+        return measured
+
+    @staticmethod
+    def cached_info(
+            cache: PackageCache) -> Callable[[Package], InfoMessage]:
+        """Функция стадии расчета через кэш, с замером при сборе
+        статистики.
+        """
+        instrumentation = INSTRUMENTATION
+        if instrumentation is not None:
+            return cached_instrumented(cache, instrumentation)
+        return lambda package: cache.get_info(*package)
+
+    def run(self, packages: Iterable[Package], dst: TextIO) -> int:
+        """Обработать пакеты и записать сообщения в dst.
+        Возвращает количество записанных сообщений.
+        """
+        if self.output_format in OUTPUT_HEADERS:
+            dst.write(OUTPUT_HEADERS[self.output_format])
+        size = self.queue_size
+        trainings: queue.Queue = queue.Queue(size)
+        infos: queue.Queue = queue.Queue(size)
+        dispatched: queue.Queue = queue.Queue(size)
+        if self.cache is not None:
+            threads = self.start_stage(
+                self.cached_info(self.cache), self.compute_threads,
+                trainings, infos, 1)
+            readers = self.compute_threads
+        else:
+            threads = self.start_stage(
+                self.measure('dispatch',
+                             lambda package: read_package(*package),
+                             lambda training: training.__class__.__name__),
+                self.dispatch_threads, trainings, dispatched,
+                self.compute_threads)
+            threads += self.start_stage(
+                self.measure('compute', Training.show_training_info,
+                             attrgetter('training_type')),
+                self.compute_threads, dispatched, infos, 1)
+            readers = self.dispatch_threads
+        reader = threading.Thread(target=self.read, daemon=True,
+                                  args=(packages, trainings, readers))
+        reader.start()
+        threads.append(reader)
+        count = self.write(infos, dst)
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+        return count
+
+
+def run_pipeline(packages: Iterable[Package], dst: TextIO,
+                 dispatch_threads: int = 1, compute_threads: int = 1,
+                 queue_size: int = BUFFER_SIZE,
+                 buffer_size: int = BUFFER_SIZE,
+                 output_format: str = 'text',
+                 cache: Optional[ThreadSafePackageCache] = None) -> int:
+    """Обработать пакеты потоковым конвейером ThreadPipeline."""
+    return ThreadPipeline(dispatch_threads, compute_threads, queue_size,
+                          buffer_size, output_format,
+                          cache).run(packages, dst)
+
+
+def split_shards(path: str, shard_size: int = SHARD_SIZE,
+                 min_shards: int = 1) -> List[Tuple[int, int]]:
+    """Разбить файл на диапазоны байт, выровненные по границам строк.
+    Диапазонов не меньше min_shards и каждый примерно по shard_size байт.
+    """
+    size = os.path.getsize(path)
+    shards = max(min_shards, -(-size // shard_size))
+    bounds = [0]
+    with open(path, 'rb') as src:
+        for i in range(1, shards):
+            src.seek(max(size * i // shards, bounds[-1] + 1) - 1)
+            src.readline()
+            offset = src.tell()
+            if bounds[-1] < offset < size:
+                bounds.append(offset)
+    if size:
+        bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def process_shard(shard: Tuple[str, int, int, str]) -> str:
+    """Обработать диапазон байт файла и вернуть результат в формате."""
+    path, start, end, output_format = shard
+    with open(path, 'rb') as src:
+        src.seek(start)
+        text = src.read(end - start).decode('utf-8')
+    dst = io.StringIO()
+    process_stream(io.StringIO(text), dst, output_format=output_format,
+                   header=False)
+    return dst.getvalue()
+
+
+def process_file_parallel(path: str, dst: TextIO,
+                          workers: Optional[int] = None,
+                          ordered: bool = True,
+                          shard_size: int = SHARD_SIZE,
+                          output_format: str = 'text') -> None:
+    """Обработать текстовый файл пакетов в пуле процессов.
+    При ordered=True результат выводится в порядке пакетов в файле,
+    иначе по мере готовности диапазонов.
+    """
+    import multiprocessing
+
+    workers = workers or os.cpu_count() or 1
+    shards = [(path, start, end, output_format) for start, end
+              in split_shards(path, shard_size, workers * 4)]
+    if output_format in OUTPUT_HEADERS:
+        dst.write(OUTPUT_HEADERS[output_format])
+    with multiprocessing.Pool(workers) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for text in imap(process_shard, shards):
+            dst.write(text)
+
+
+PARTITION_SCHEMES: Tuple[str, ...] = ('type', 'hash')
+
+
+def partition_name(workout_type: str, data: List[float], scheme: str,
+                   partitions: int) -> str:
+    """Вернуть имя раздела пакета.
+    Схема type раскладывает пакеты по кодам тренировок, схема hash — по
+    crc32 содержимого пакета, одинаково на любой машине.
+    """
+    if scheme == 'type':
+        return workout_type
+    key = json.dumps([workout_type, data]).encode()
+    return '%04d' % (zlib.crc32(key) % partitions)
+
+
+def partition_packages(packages: Iterable[Package], path: str,
+                       scheme: str = 'hash', partitions: int = 8) -> List[str]:
+    """Разложить пакеты по файлам разделов в каталоге path.
+    Каждая строка раздела хранит порядковый номер пакета во входе, по
+    которому объединяются результаты. Возвращает имена разделов.
+    """
+    if scheme not in PARTITION_SCHEMES:
+        raise ValueError("Неизвестная схема разбиения '%s'." % (scheme))
+    os.makedirs(path, exist_ok=True)
+    manifest = os.path.join(path, 'partitions.json')
+    if os.path.exists(manifest):
+        raise ValueError("Каталог '%s' уже разбит на разделы." % (path))
+    files: Dict[str, TextIO] = {}
+    with ExitStack() as stack:
+        for sequence, (workout_type, data) in enumerate(packages):
+            name = partition_name(workout_type, data, scheme, partitions)
+            if name not in files:
+                files[name] = stack.enter_context(open(
+                    partition_file(path, 'part', name), 'w',
+                    encoding='utf-8'))
+            files[name].write(json.dumps([sequence, workout_type, data]))
+            files[name].write('\n')
+    names = sorted(files)
+    with open(manifest, 'w') as dst:
+        json.dump({'scheme': scheme, 'partitions': names}, dst)
+    return names
+
+
+def partition_file(path: str, kind: str, name: str) -> str:
+    """Вернуть путь к файлу раздела: part, result, aggregate или done."""
+    extension = '.json' if kind in ('aggregate', 'done') else '.jsonl'
+    return os.path.join(path, '%s-%s%s' % (kind, name, extension))
+
+
+def read_checkpoint(path: str, name: str) -> Optional[Dict[str, Any]]:
+    """Вернуть отметку о завершении раздела, если она актуальна."""
+    checkpoint = partition_file(path, 'done', name)
+    if not os.path.exists(checkpoint):
+        return None
+    with open(checkpoint) as src:
+        state = json.load(src)
+    if state['source_size'] != os.path.getsize(
+            partition_file(path, 'part', name)):
+        return None
+    return state
+
+
+def write_atomic(path: str, text: str) -> None:
+    """Записать файл целиком или не записать вовсе."""
+    with open(path + '.tmp', 'w', encoding='utf-8') as dst:
+        dst.write(text)
+    os.replace(path + '.tmp', path)
+
+
+def process_partition(path: str, name: str,
+                      output_format: str = 'text') -> int:
+    """Обработать один раздел: записать результат, агрегаты и отметку.
+    Отметка о завершении пишется последней, поэтому прерванный раздел
+    будет обработан заново. Возвращает количество пакетов.
+    """
+    render = OUTPUT_FORMATS[output_format]
+    aggregator = TrainingAggregator()
+    result = partition_file(path, 'result', name)
+    count = 0
+    with open(partition_file(path, 'part', name), encoding='utf-8') as src, \
+            open(result + '.tmp', 'w', encoding='utf-8') as dst:
+        while True:
+            lines = src.readlines(CHUNK_SIZE)
+            if not lines:
+                break
+            sequences = []
+            messages = []
+            for line in lines:
+                sequence, workout_type, data = json.loads(line)
+                info = read_package(workout_type, data).show_training_info()
+                aggregator.add_message(info)
+                sequences.append(sequence)
+                messages.append(info)
+            dst.writelines('%d\t%s\n' % row for row in zip(
+                sequences, render(messages).splitlines()))
+            count += len(lines)
+    os.replace(result + '.tmp', result)
+    write_atomic(partition_file(path, 'aggregate', name),
+                 json.dumps(aggregator.to_dict()))
+    write_atomic(partition_file(path, 'done', name), json.dumps({
+        'records': count,
+        'output_format': output_format,
+        'source_size': os.path.getsize(partition_file(path, 'part', name)),
+    }))
+    return count
+
+
+def run_partition(task: Tuple[str, str, str]) -> Tuple[str, Optional[str]]:
+    """Обработать раздел в процессе пула, вернуть имя и текст ошибки."""
+    path, name, output_format = task
+    try:
+        process_partition(path, name, output_format)
+    except Exception as error:
+        return name, repr(error)
+    return name, None
+
+
+def pending_partitions(path: str, output_format: str = 'text') -> List[str]:
+    """Вернуть разделы без актуальной отметки о завершении."""
+    with open(os.path.join(path, 'partitions.json')) as src:
+        names = json.load(src)['partitions']
+    pending = []
+    for name in names:
+        checkpoint = read_checkpoint(path, name)
+        if checkpoint is None or checkpoint['output_format'] != output_format:
+            pending.append(name)
+    return pending
+
+
+def run_partitions(path: str, workers: Optional[int] = None,
+                   output_format: str = 'text') -> Dict[str, str]:
+    """Обработать незавершенные разделы в пуле процессов.
+    Завершенные разделы пропускаются, поэтому после сбоя достаточно
+    запустить функцию еще раз. Возвращает ошибки по именам разделов.
+    """
+    import multiprocessing
+
+    if output_format not in ('text', 'csv', 'jsonl'):
+        raise ValueError(
+            "Формат '%s' не поддерживает объединение разделов."
+            % (output_format))
+    tasks = [(path, name, output_format)
+             for name in pending_partitions(path, output_format)]
+    if not tasks:
+        return {}
+    with multiprocessing.Pool(min(len(tasks), workers or os.cpu_count()
+                                  or 1)) as pool:
+        return {name: error for name, error
+                in pool.imap_unordered(run_partition, tasks) if error}
+
+
+def merge_partitions(path: str, dst: TextIO,
+                     output_format: str = 'text') -> TrainingAggregator:
+    """Объединить результаты разделов в порядке пакетов во входе.
+    Агрегаты объединяются в порядке имен разделов, поэтому итог не
+    зависит от того, где и когда обрабатывались разделы.
+    """
+    pending = pending_partitions(path, output_format)
+    if pending:
+        raise RuntimeError(
+            'Разделы не обработаны: %s.' % (', '.join(pending)))
+    with open(os.path.join(path, 'partitions.json')) as src:
+        names = json.load(src)['partitions']
+    aggregator = TrainingAggregator()
+    with ExitStack() as stack:
+        results = [stack.enter_context(open(
+            partition_file(path, 'result', name), encoding='utf-8'))
+            for name in names]
+        if output_format in OUTPUT_HEADERS:
+            dst.write(OUTPUT_HEADERS[output_format])
+        for line in heapq.merge(*results,
+                                key=lambda line: int(line[:line.index('\t')])):
+            dst.write(line[line.index('\t') + 1:])
+    for name in names:
+        with open(partition_file(path, 'aggregate', name)) as src:
+            aggregator.merge(TrainingAggregator.from_dict(json.load(src)))
+    return aggregator
+
+
+BINARY_CODE = struct.Struct('<3s')
+
+
+def encode_package(workout_type: str, data: List[float]) -> bytes:
+    """Упаковать пакет в бинарную запись фиксированной длины.
+    Запись начинается с трехбайтового кода тренировки, за которым следуют
+    параметры: action и count_pool как uint32, остальные как double.
+    """
+    return BINARY_FORMATS[workout_type].pack(workout_type.encode(), *data)
+
+
+def write_binary(packages: Iterable[Package], stream: BinaryIO) -> int:
+    """Записать пакеты в бинарный поток, вернуть количество записей."""
+    count = 0
+    for workout_type, data in packages:
+        stream.write(encode_package(workout_type, data))
+        count += 1
+    return count
+
+
+def iter_binary_records(
+        buffer: Buffer) -> Iterator[Tuple[str, struct.Struct, int]]:
+    """Обойти записи буфера без копирования.
+    Возвращает код тренировки, формат записи и смещение записи в буфере.
+    """
+    formats = {code.encode(): (code, record)
+               for code, record in BINARY_FORMATS.items()}
+    with memoryview(buffer) as view:
+        offset = 0
+        size = len(view)
+        while offset < size:
+            workout_type, record = formats[
+                BINARY_CODE.unpack_from(view, offset)[0]]
+            yield workout_type, record, offset
+            offset += record.size
+
+
+def iter_binary_packages(buffer: Buffer) -> Iterator[Package]:
+    """Лениво декодировать пакеты из бинарного буфера."""
+    for workout_type, record, offset in iter_binary_records(buffer):
+        yield workout_type, list(record.unpack_from(buffer, offset)[1:])
+
+
+def decode_binary_columns(buffer: Buffer) -> Dict[str, Dict[str, list]]:
+    """Декодировать бинарный буфер в колонки для calculate_batch.
+    Возвращает словарь колонок параметров для каждого кода тренировки.
+    """
+    columns: Dict[str, Dict[str, list]] = {}
+    for workout_type, record, offset in iter_binary_records(buffer):
+        if workout_type not in columns:
+            columns[workout_type] = {
+                name: [] for name in inspect.signature(
+                    TRAINING_CODES_AND_CLASSES[workout_type]).parameters}
+        values = record.unpack_from(buffer, offset)
+        for column, value in zip(columns[workout_type].values(),
+                                 values[1:]):
+            column.append(value)
+    return columns
+
+
+def iter_binary_stream(stream: BinaryIO,
+                       chunk_size: int = CHUNK_SIZE) -> Iterator[Package]:
+    """Лениво декодировать пакеты из бинарного потока, например stdin.
+    Поток читается порциями примерно по chunk_size байт, неполная запись
+    в конце порции переносится в следующую, поэтому память не зависит от
+    размера потока.
+    """
+    formats = {code.encode(): (code, record)
+               for code, record in BINARY_FORMATS.items()}
+    code_size = BINARY_CODE.size
+    buffer = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        offset = 0
+        size = len(buffer)
+        while offset + code_size <= size:
+            workout_type, record = formats[
+                BINARY_CODE.unpack_from(buffer, offset)[0]]
+            if offset + record.size > size:
+                break
+            yield workout_type, list(record.unpack_from(buffer, offset)[1:])
+            offset += record.size
+        buffer = buffer[offset:]
+    if buffer:
+        raise ValueError('Бинарный поток оборван посреди записи.')
+
+
+def iter_binary_file(path: str) -> Iterator[Package]:
+    """Лениво читать пакеты из бинарного файла через mmap."""
+    if not os.path.getsize(path):
+        return
+    with open(path, 'rb') as src, mmap.mmap(
+            src.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        yield from iter_binary_packages(buffer)
+
+
+class WorkoutStore:
+    """Хранилище рассчитанных тренировок в колонках на диске.
+    Каждая числовая колонка лежит в отдельном файле double, записи только
+    дописываются в конец. Индекс по виду тренировки хранит номера строк
+    каждого кода, а для блоков по block_rows строк вида хранятся минимум
+    и максимум каждой колонки, чтобы запросы по диапазонам пропускали
+    блоки целиком. Чтение идет через mmap без загрузки файлов в память.
+    Нельзя дописывать записи, пока не исчерпан итератор запроса.
+    """
+
+    COLUMNS: ClassVar[Tuple[str, ...]] = INFO_FIELDS[1:] + (
+        'action', 'weight', 'height', 'length_pool', 'count_pool')
+
+    def __init__(self, path: str, buffer_rows: int = 65536,
+                 block_rows: int = 4096) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.buffer_rows = buffer_rows
+        self.block_rows = block_rows
+        self.types: List[str] = []
+        if os.path.exists(self.file('meta.json')):
+            with open(self.file('meta.json')) as src:
+                meta = json.load(src)
+            self.types = meta['types']
+            self.block_rows = meta['block_rows']
+        self.pending: Dict[str, array] = {
+            name: array('d') for name in self.COLUMNS}
+        self.pending_types = array('B')
+        self.views: Dict[str, memoryview] = {}
+        self.params: Dict[str, Tuple[str, ...]] = {}
+
+    def __enter__(self) -> 'WorkoutStore':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return (len(self.view('training_type', 'B'))
+                + len(self.pending_types))
+
+    def file(self, name: str) -> str:
+        """Вернуть путь к файлу колонки или индекса."""
+        return os.path.join(self.path, name)
+
+    def append(self, workout_type: str, data: List[float],
+               record: Optional[InfoRecord] = None) -> None:
+        """Дописать пакет и его рассчитанные поля.
+        Если record не передан, поля рассчитываются через read_package.
+        """
+        if record is None:
+            record = read_package(workout_type, data).show_training_record()
+        if workout_type not in self.params:
+            self.params[workout_type] = tuple(inspect.signature(
+                TRAINING_CODES_AND_CLASSES[workout_type]).parameters)
+            if workout_type not in self.types:
+                self.types.append(workout_type)
+        self.pending_types.append(self.types.index(workout_type))
+        params = dict(zip(self.params[workout_type], data))
+        params.update(zip(INFO_FIELDS[1:], record[1:]))
+        for name, column in self.pending.items():
+            column.append(params.get(name, math.nan))
+        if len(self.pending_types) >= self.buffer_rows:
+            self.flush()
+
+    def extend(self, packages: Iterable[Package]) -> int:
+        """Дописать пакеты, вернуть их количество."""
+        count = 0
+        for workout_type, data in packages:
+            self.append(workout_type, data)
+            count += 1
+        return count
+
+    def flush(self) -> None:
+        """Записать буфер на диск и обновить индексы."""
+        if not self.pending_types:
+            return
+        base = len(self.view('training_type', 'B'))
+        self.views.clear()
+        with open(self.file('meta.json'), 'w') as dst:
+            json.dump({'types': self.types,
+                       'block_rows': self.block_rows}, dst)
+        for name, column in self.pending.items():
+            with open(self.file(name), 'ab') as dst:
+                column.tofile(dst)
+        with open(self.file('training_type'), 'ab') as dst:
+            self.pending_types.tofile(dst)
+        for index, workout_type in enumerate(self.types):
+            rows = array('I', (
+                base + row for row, value in enumerate(self.pending_types)
+                if value == index))
+            if rows:
+                self.update_zones(workout_type, rows, base)
+                with open(self.file('rows_' + workout_type), 'ab') as dst:
+                    rows.tofile(dst)
+        self.pending_types = array('B')
+        for column in self.pending.values():
+            del column[:]
+
+    def update_zones(self, workout_type: str, rows: array,
+                     base: int) -> None:
+        """Пересчитать минимумы и максимумы блоков для новых строк вида."""
+        width = 2 * len(self.COLUMNS)
+        first = len(self.view('rows_' + workout_type, 'I'))
+        block = first // self.block_rows
+        zones = array('d', self.view('zones_' + workout_type, 'd')[
+            block * width:(block + 1) * width])
+        self.views.clear()
+        for position, row in enumerate(rows, first):
+            if position % self.block_rows == 0:
+                zones.extend([math.inf, -math.inf] * len(self.COLUMNS))
+            offset = len(zones) - width
+            for index, column in enumerate(self.pending.values()):
+                value = column[row - base]
+                if value == value:
+                    zones[offset + 2 * index] = min(
+                        zones[offset + 2 * index], value)
+                    zones[offset + 2 * index + 1] = max(
+                        zones[offset + 2 * index + 1], value)
+        path = self.file('zones_' + workout_type)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as dst:
+            dst.seek(block * width * zones.itemsize)
+            zones.tofile(dst)
+
+    def view(self, name: str, typecode: str) -> memoryview:
+        """Вернуть файл колонки или индекса как memoryview через mmap."""
+        if name not in self.views:
+            path = self.file(name)
+            if not os.path.exists(path) or not os.path.getsize(path):
+                return memoryview(array(typecode))
+            with open(path, 'rb') as src:
+                buffer = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+            self.views[name] = memoryview(buffer).cast(typecode)
+        return self.views[name]
+
+    def column(self, name: str) -> memoryview:
+        """Вернуть числовую колонку записанных строк."""
+        self.flush()
+        return self.view(name, 'd')
+
+    def record(self, row: int) -> InfoRecord:
+        """Вернуть рассчитанные поля строки."""
+        self.flush()
+        workout_type = self.types[self.view('training_type', 'B')[row]]
+        return InfoRecord(
+            TRAINING_CODES_AND_CLASSES[workout_type].__name__,
+            *(self.view(name, 'd')[row] for name in INFO_FIELDS[1:]))
+
+    def package(self, row: int) -> Package:
+        """Вернуть исходный пакет строки."""
+        self.flush()
+        workout_type = self.types[self.view('training_type', 'B')[row]]
+        return workout_type, [
+            self.view(name, 'd')[row] for name in inspect.signature(
+                TRAINING_CODES_AND_CLASSES[workout_type]).parameters]
+
+    def query(self, workout_type: Optional[str] = None,
+              **ranges: Tuple[Optional[float], Optional[float]]
+              ) -> Iterator[int]:
+        """Вернуть номера строк вида с колонками в заданных диапазонах.
+        Диапазон задается парой (нижняя, верхняя) включительно, None
+        означает отсутствие границы. Строки выдаются по возрастанию.
+        """
+        self.flush()
+        bounds = [(self.COLUMNS.index(name),
+                   -math.inf if low is None else low,
+                   math.inf if high is None else high)
+                  for name, (low, high) in ranges.items()]
+        codes = self.types if workout_type is None else [workout_type]
+        yield from heapq.merge(*(
+            self.scan(code, bounds) for code in codes if code in self.types))
+
+    def scan(self, workout_type: str,
+             bounds: List[Tuple[int, float, float]]) -> Iterator[int]:
+        """Обойти блоки вида, пропуская блоки вне диапазонов."""
+        rows = self.view('rows_' + workout_type, 'I')
+        zones = self.view('zones_' + workout_type, 'd')
+        columns = [(self.view(self.COLUMNS[index], 'd'), low, high)
+                   for index, low, high in bounds]
+        width = 2 * len(self.COLUMNS)
+        for start in range(0, len(rows), self.block_rows):
+            offset = start // self.block_rows * width
+            if any(zones[offset + 2 * index] > high
+                   or zones[offset + 2 * index + 1] < low
+                   for index, low, high in bounds):
+                continue
+            for row in rows[start:start + self.block_rows]:
+                if all(low <= column[row] <= high
+                       for column, low, high in columns):
+                    yield row
+
+    def select(self, workout_type: Optional[str] = None,
+               **ranges: Tuple[Optional[float], Optional[float]]
+               ) -> Iterator[InfoRecord]:
+        """Вернуть рассчитанные поля строк, подходящих под запрос."""
+        for row in self.query(workout_type, **ranges):
+            yield self.record(row)
+
+    def recalculate(self, path: str, old: Optional[str] = None,
+                    new: Optional[str] = None,
+                    chunk_rows: int = 65536) -> 'WorkoutStore':
+        """Записать в новое хранилище строки с показателями версии new.
+        Строки обрабатываются частями по chunk_rows через recalculate_batch,
+        поэтому сохраненные показатели неизмененных этапов не считаются
+        заново. Порядок строк сохраняется.
+        """
+        self.flush()
+        target = WorkoutStore(path, self.buffer_rows, self.block_rows)
+        if len(target):
+            raise ValueError(
+                "Хранилище '%s' для пересчета должно быть пустым." % (path))
+        target.types = list(self.types)
+        types = self.view('training_type', 'B')
+        for start in range(0, len(types), chunk_rows):
+            stop = min(start + chunk_rows, len(types))
+            chunk = {name: array('d', self.view(name, 'd')[start:stop])
+                     for name in self.COLUMNS}
+            for index, workout_type in enumerate(self.types):
+                selected = [row - start for row in range(start, stop)
+                            if types[row] == index]
+                if not selected:
+                    continue
+                columns = {name: [column[row] for row in selected]
+                           for name, column in chunk.items()}
+                result = recalculate_batch(workout_type, columns, columns,
+                                           old, new)
+                for name in INFO_FIELDS[2:]:
+                    for row, value in zip(selected, result[name]):
+                        chunk[name][row] = value
+            target.pending_types.extend(types[start:stop])
+            for name, column in chunk.items():
+                target.pending[name].extend(column)
+            target.flush()
+        return target
+
+    def close(self) -> None:
+        """Записать буфер и освободить отображения файлов."""
+        self.flush()
+        self.views.clear()
+
+
+def reply_package(line: Union[str, bytes]) -> str:
+    """Вернуть сообщение для строки пакета или текст ошибки.
+    Строка в байтах декодируется как UTF-8, ошибка декодирования тоже
+    возвращается текстом.
+    """
+    try:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        return read_package(*parse_package(line)).show_training_info(
+        ).get_message()
+    except (KeyError, TypeError, ValueError, ZeroDivisionError) as error:
+        return 'Ошибка: %r' % (error,)
+
+
+async def handle_connection(reader: 'asyncio.StreamReader',
+                            writer: 'asyncio.StreamWriter') -> None:
+    """Обработать соединение с датчиками.
+    Пакеты принимаются построчно; ответы на все пакеты, прочитанные за одно
+    чтение, отправляются одной записью. Ожидание drain() приостанавливает
+    чтение, пока клиент не заберет ответы. На строку длиннее MAX_LINE_SIZE
+    байт, в том числе еще не завершенную, клиент получает ошибку, и
+    соединение закрывается.
+    """
+    tail = b''
+    try:
+        while True:
+            chunk = await reader.read(CHUNK_SIZE)
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop() if chunk else b''
+            if len(tail) > MAX_LINE_SIZE:
+                lines.append(tail)
+            replies = []
+            for line in lines:
+                if len(line) > MAX_LINE_SIZE:
+                    replies.append('Ошибка: строка длиннее %d байт' % (
+                        MAX_LINE_SIZE))
+                    chunk = b''
+                    break
+                if line.strip():
+                    replies.append(reply_package(line))
+            if replies:
+                writer.write(('\n'.join(replies) + '\n').encode('utf-8'))
+                await writer.drain()
+            if not chunk:
+                return
+    except ConnectionError:
+        return
+    finally:
+        writer.close()
+
+
+async def start_server(host: str = '127.0.0.1', port: int = 8888,
+                       path: Optional[str] = None
+                       ) -> 'asyncio.AbstractServer':
+    """Запустить сервер приема пакетов на TCP порту или unix сокете."""
+    import asyncio
+
+    if path is not None:
+        return await asyncio.start_unix_server(handle_connection, path)
+    return await asyncio.start_server(handle_connection, host, port)
+
+
+async def serve(host: str = '127.0.0.1', port: int = 8888,
+                path: Optional[str] = None) -> None:
+    """Обслуживать соединения, пока сервер не будет остановлен."""
+    server = await start_server(host, port, path)
+    async with server:
+        await server.serve_forever()
+
+
+GENERATOR_MIX: Dict[str, float] = {'RUN': 0.5, 'WLK': 0.3, 'SWM': 0.2}
+GENERATOR_PARAMS: Dict[str, Dict[str, Tuple[Any, ...]]] = {
+    'RUN': {
+        'action': ('randint', 500, 25000),
+        'duration': ('triangular', 0.25, 3, 0.75),
+        'weight': ('triangular', 45, 120, 75),
+    },
+    'WLK': {
+        'action': ('randint', 500, 20000),
+        'duration': ('triangular', 0.25, 3, 1),
+        'weight': ('triangular', 45, 120, 75),
+        'height': ('triangular', 150, 205, 175),
+    },
+    'SWM': {
+        'action': ('randint', 50, 2500),
+        'duration': ('triangular', 0.25, 2, 0.75),
+        'weight': ('triangular', 45, 120, 75),
+        'length_pool': ('choice', (25, 50)),
+        'count_pool': ('randint', 4, 80),
+    },
+}
+INVALID_KINDS: Tuple[str, ...] = ('duration', 'weight', 'arity', 'code')
+
+
+class PackageGenerator:
+    """Детерминированный генератор пакетов для нагрузочных тестов.
+    mix задает доли кодов тренировок, params — распределения параметров
+    как имя метода random.Random и его аргументы. Доля duplicate_ratio
+    пакетов повторяет один из window последних, доля invalid_rate
+    портится одним из способов invalid_kinds. Память не зависит от
+    количества пакетов.
+    """
+
+    def __init__(self, seed: int = 0,
+                 mix: Optional[Dict[str, float]] = None,
+                 params: Optional[Dict[str, Dict[str, Tuple[Any, ...]]]]
+                 = None,
+                 duplicate_ratio: float = 0.0, invalid_rate: float = 0.0,
+                 invalid_kinds: Sequence[str] = INVALID_KINDS,
+                 window: int = 1000) -> None:
+        import random
+
+        self.random = random.Random(seed)
+        mix = mix or GENERATOR_MIX
+        params = params or GENERATOR_PARAMS
+        self.codes = list(mix)
+        self.weights = list(accumulate(mix.values()))
+        self.samplers = {code: build_sampler(params[code], self.random)
+                         for code in self.codes}
+        self.duplicate_ratio = duplicate_ratio
+        self.invalid_rate = invalid_rate
+        self.invalid_kinds = invalid_kinds
+        self.recent: List[Package] = []
+        self.window = window
+        self.position = 0
+
+    def __iter__(self) -> Iterator[Package]:
+        while True:
+            yield self.package()
+
+    def package(self) -> Package:
+        """Вернуть следующий пакет."""
+        rnd = self.random
+        if self.recent and rnd.random() < self.duplicate_ratio:
+            return self.recent[int(rnd.random() * len(self.recent))]
+        workout_type = self.codes[bisect.bisect(
+            self.weights, rnd.random() * self.weights[-1])]
+        package = workout_type, self.samplers[workout_type]()
+        if self.invalid_rate and rnd.random() < self.invalid_rate:
+            package = self.spoil(package)
+        if len(self.recent) < self.window:
+            self.recent.append(package)
+        else:
+            self.recent[self.position] = package
+            self.position = (self.position + 1) % self.window
+        return package
+
+    def spoil(self, package: Package) -> Package:
+        """Испортить пакет так, чтобы его отклонил validate_package."""
+        workout_type, data = package
+        kind = self.random.choice(self.invalid_kinds)
+        if kind == 'duration':
+            return workout_type, [data[0], -data[1], *data[2:]]
+        if kind == 'weight':
+            return workout_type, [*data[:2], 0, *data[3:]]
+        if kind == 'arity':
+            return workout_type, data[:-1]
+        return 'XXX', data
+
+    def packages(self, count: int) -> Iterator[Package]:
+        """Вернуть count следующих пакетов."""
+        return islice(self, count)
+
+
+def build_sampler(params: Dict[str, Tuple[Any, ...]],
+                  rnd: Any) -> Callable[[], List[float]]:
+    """Собрать функцию, возвращающую список параметров пакета.
+    randint, uniform, triangular и choice раскрываются в выражения над
+    rnd.random() с подставленными границами, прочие методы rnd
+    вызываются как есть. Дробные значения округляются до сотых.
+    """
+    namespace: Dict[str, Any] = {'random': rnd.random, 'sqrt': math.sqrt}
+    expressions = []
+    for index, (kind, *args) in enumerate(params.values()):
+        if kind == 'randint':
+            low, high = args
+            expression = '%r + int(random() * %r)' % (low, high - low + 1)
+        elif kind == 'uniform':
+            low, high = args
+            expression = 'round(%r + random() * %r, 2)' % (low, high - low)
+        elif kind == 'triangular':
+            low, high, mode = args
+            expression = (
+                'round(%r + sqrt(u * %r) if (u := random()) < %r '
+                'else %r - sqrt((1 - u) * %r), 2)' % (
+                    low, (high - low) * (mode - low),
+                    (mode - low) / (high - low), high,
+                    (high - low) * (high - mode)))
+        elif kind == 'choice':
+            values, = args
+            expression = '%r[int(random() * %r)]' % (tuple(values),
+                                                     len(values))
+        else:
+            namespace['sample_%d' % index] = getattr(rnd, kind)
+            expression = 'round(sample_%d(*%r), 2)' % (index, tuple(args))
+        expressions.append(expression)
+    return eval('lambda: [%s]' % ', '.join(expressions), namespace)
+
+
+def format_package_csv(package: Package) -> str:
+    """Сформировать строку пакета `CODE,v1,v2,...`."""
+    workout_type, data = package
+    return '%s,%s\n' % (workout_type, ','.join(map(str, data)))
+
+
+def format_package_jsonl(package: Package) -> str:
+    """Сформировать строку пакета `["CODE", [v1, v2, ...]]`.
+    Числа записываются через str, как и в json.dumps.
+    """
+    workout_type, data = package
+    return '["%s", [%s]]\n' % (workout_type, ', '.join(map(str, data)))
+
+
+def write_packages(packages: Iterable[Package], stream: TextIO,
+                   output_format: str = 'csv',
+                   batch_size: int = BUFFER_SIZE) -> int:
+    """Записать пакеты в текстовый поток порциями, вернуть их количество."""
+    render = (format_package_csv if output_format == 'csv'
+              else format_package_jsonl)
+    count = 0
+    packages = iter(packages)
+    while True:
+        lines = list(map(render, islice(packages, batch_size)))
+        if not lines:
+            return count
+        stream.write(''.join(lines))
+        count += len(lines)
+
+
+PROFILE_METHODS: Tuple[str, ...] = (
+    'read_package', 'show_training_info', 'get_metrics', 'get_distance',
+    'get_mean_speed', 'get_spent_calories', 'get_message')
+
+
+def run_profiled(packages: Iterable[Package]) -> List[str]:
+    """Прогнать пакеты через read_package, show_training_info и get_message."""
+    return [read_package(workout_type, data).show_training_info().get_message()
+            for workout_type, data in packages]
+
+
+def group_packages(packages: Iterable[Package]) -> Dict[str, List[Package]]:
+    """Разложить пакеты по именам классов тренировок."""
+    groups: Dict[str, List[Package]] = {}
+    for workout_type, data in packages:
+        training_class = TRAINING_CODES_AND_CLASSES[workout_type]
+        groups.setdefault(training_class.__name__, []).append(
+            (workout_type, data))
+    return groups
+
+
+def profile_methods(packages: List[Package]) -> Dict[str, Dict[str, float]]:
+    """Замерить методы PROFILE_METHODS под cProfile.
+    Вызовы одного метода из разных мест суммируются.
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.runcall(run_profiled, packages)
+    methods: Dict[str, Dict[str, float]] = {}
+    for (filename, _, name), (_, calls, tottime, cumtime, _) in (
+            pstats.Stats(profiler).stats.items()):
+        if filename == __file__ and name in PROFILE_METHODS:
+            method = methods.setdefault(
+                name, {'calls': 0, 'tottime': 0.0, 'cumtime': 0.0})
+            method['calls'] += calls
+            method['tottime'] += tottime
+            method['cumtime'] += cumtime
+    return methods
+
+
+def profile_allocations(packages: List[Package],
+                        top: int = 10) -> Dict[str, Any]:
+    """Посчитать выделения памяти в homework.py через tracemalloc.
+    Результаты прогона удерживаются до снимка, поэтому учитываются
+    созданные объекты и строки, peak — пиковая память прогона.
+    """
+    import linecache
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = run_profiled(packages)
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    lines = [difference for difference in after.filter_traces([
+        tracemalloc.Filter(True, __file__)]).compare_to(
+            before.filter_traces([tracemalloc.Filter(True, __file__)]),
+            'lineno') if difference.count_diff > 0]
+    return {
+        'blocks': sum(difference.count_diff for difference in lines),
+        'size': sum(difference.size_diff for difference in lines),
+        'peak': peak,
+        'lines': [{
+            'line': difference.traceback[0].lineno,
+            'code': linecache.getline(
+                __file__, difference.traceback[0].lineno).strip(),
+            'blocks': difference.count_diff,
+            'size': difference.size_diff,
+        } for difference in lines[:top]],
+    }
+
+
+class StackProfiler:
+    """Сбор свернутых стеков вызовов для flamegraph через sys.setprofile.
+    Для каждого стека копится собственное время в микросекундах, корнем
+    стека служит переданная метка, например имя класса тренировки.
+    """
+
+    def __init__(self) -> None:
+        self.stacks: Dict[str, float] = {}
+        self.frames: List[List[Any]] = []
+
+    def trace(self, frame: Any, event: str, arg: Any) -> None:
+        """Обработчик sys.setprofile."""
+        now = time.perf_counter()
+        if event in ('call', 'c_call'):
+            name = (arg.__qualname__ if event == 'c_call' else getattr(
+                frame.f_code, 'co_qualname', frame.f_code.co_name))
+            self.frames.append([name, now, 0.0])
+        elif event in ('return', 'c_return', 'c_exception') and (
+                len(self.frames) > 1):
+            name, start, children = self.frames.pop()
+            elapsed = now - start
+            key = ';'.join(frame[0] for frame in self.frames) + ';' + name
+            self.stacks[key] = (self.stacks.get(key, 0.0)
+                                + elapsed - children)
+            self.frames[-1][2] += elapsed
+
+    def run(self, root: str, function: Callable[..., Any],
+            *args: Any) -> Any:
+        """Вызвать функцию, собирая стеки под меткой root."""
+        self.frames = [[root, time.perf_counter(), 0.0]]
+        sys.setprofile(self.trace)
+        try:
+            return function(*args)
+        finally:
+            sys.setprofile(None)
+            self.frames = []
+
+    def write(self, stream: TextIO) -> None:
+        """Записать стеки в формате `кадр;кадр;... микросекунды`."""
+        for key, seconds in sorted(self.stacks.items()):
+            if seconds * 1e6 >= 1:
+                stream.write('%s %d\n' % (key, seconds * 1e6))
+
+
+def profile_packages(packages: Iterable[Package],
+                     collapsed: Optional[TextIO] = None,
+                     top: int = 10) -> Dict[str, Dict[str, Any]]:
+    """Профилировать обработку пакетов отдельно для каждого вида.
+    Каждый вид прогоняется отдельно, поэтому унаследованные методы,
+    например Training.get_distance, учитываются в своем подклассе.
+    Если задан collapsed, в него пишутся свернутые стеки для flamegraph.
+    """
+    report: Dict[str, Dict[str, Any]] = {}
+    stacks = StackProfiler()
+    for training_type, group in sorted(group_packages(packages).items()):
+        report[training_type] = {
+            'packages': len(group),
+            'methods': profile_methods(group),
+            'allocations': profile_allocations(group, top),
+        }
+        if collapsed is not None:
+            stacks.run(training_type, run_profiled, group)
+    if collapsed is not None:
+        stacks.write(collapsed)
+    return report
+
+
+def format_profile(report: Dict[str, Dict[str, Any]]) -> str:
+    """Сформировать таблицу отчета profile_packages."""
+    lines = ['%-14s %-20s %10s %12s %12s' % (
+        'training_type', 'method', 'calls', 'tottime, мс', 'cumtime, мс')]
+    for training_type, profile in report.items():
+        for name in PROFILE_METHODS:
+            if name in profile['methods']:
+                method = profile['methods'][name]
+                lines.append('%-14s %-20s %10d %12.1f %12.1f' % (
+                    training_type, name, method['calls'],
+                    method['tottime'] * 1e3, method['cumtime'] * 1e3))
+        allocations = profile['allocations']
+        lines.append('%-14s %-20s %10d %12s %12s' % (
+            training_type, 'allocations', allocations['blocks'],
+            '%d КБ' % (allocations['size'] // 1024),
+            'пик %d КБ' % (allocations['peak'] // 1024)))
+    return '\n'.join(lines) + '\n'
+
+
+SAMPLE_PACKAGES: List[Package] = [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [15000, 1, 75]),
+    ('WLK', [9000, 1, 75, 180]),
+]
+
+
+def build_parser() -> 'argparse.ArgumentParser':
+    """Собрать разбор аргументов командной строки."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='homework',
+        description='Расчет показателей тренировок по пакетам датчиков.')
+    parser.add_argument('--metrics',
+                        help='сохранить статистику стадий (.json или .prom)')
+    commands = parser.add_subparsers(dest='command')
+
+    process = commands.add_parser('process', help='обработать файл пакетов')
+    process.add_argument('input', help="файл с пакетами, '-' для stdin")
+    process.add_argument('output', nargs='?', default='-',
+                         help="файл результата, '-' для stdout")
+    process.add_argument('--input-format', default='auto',
+                         choices=('auto', 'csv', 'jsonl', 'binary'),
+                         help='auto: binary для файлов .bin, иначе текст')
+    process.add_argument('--output-format', default='text',
+                         choices=list(OUTPUT_FORMATS))
+    process.add_argument('--batch-size', type=int,
+                         help='сообщений в одной записи результата, '
+                              'по умолчанию %d' % BUFFER_SIZE)
+    process.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                         help='байт в одном чтении входного потока')
+    process.add_argument('--workers', type=int,
+                         help='обработать текстовый файл в N процессах')
+    process.add_argument('--unordered', action='store_true',
+                         help='не сохранять порядок пакетов при --workers')
+    process.add_argument('--threads', type=int,
+                         help='обрабатывать в конвейере из N потоков расчета')
+    process.add_argument('--rejects',
+                         help='проверять пакеты и писать отклоненные в файл')
+    process.add_argument('--cache', type=int, default=0,
+                         help='кэшировать сообщения для N последних пакетов')
+
+    partition = commands.add_parser(
+        'partition', help='разложить пакеты по разделам для обработки')
+    partition.add_argument('input', help="файл с пакетами, '-' для stdin")
+    partition.add_argument('directory', help='каталог разделов')
+    partition.add_argument('--scheme', default='hash',
+                           choices=PARTITION_SCHEMES)
+    partition.add_argument('--partitions', type=int, default=8,
+                           help='количество разделов для схемы hash')
+
+    worker = commands.add_parser(
+        'worker', help='обработать разделы без отметки о завершении')
+    worker.add_argument('directory', help='каталог разделов')
+    worker.add_argument('names', nargs='*',
+                        help='имена разделов, по умолчанию все')
+    worker.add_argument('--output-format', default='text',
+                        choices=('text', 'csv', 'jsonl'))
+    worker.add_argument('--workers', type=int,
+                        help='процессов для обработки всех разделов')
+
+    merge = commands.add_parser('merge', help='объединить результаты')
+    merge.add_argument('directory', help='каталог разделов')
+    merge.add_argument('output', nargs='?', default='-',
+                       help="файл результата, '-' для stdout")
+    merge.add_argument('--output-format', default='text',
+                       choices=('text', 'csv', 'jsonl'))
+    merge.add_argument('--aggregate',
+                       help='сохранить объединенные агрегаты в JSON')
+
+    generate = commands.add_parser(
+        'generate', help='сгенерировать пакеты для нагрузочных тестов')
+    generate.add_argument('output', nargs='?', default='-',
+                          help="файл пакетов, '-' для stdout")
+    generate.add_argument('--count', type=int, default=1000)
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--format', default='auto',
+                          choices=('auto', 'csv', 'jsonl', 'binary'),
+                          help='auto: binary для файлов .bin, иначе csv')
+    generate.add_argument('--mix', type=parse_mix, default=GENERATOR_MIX,
+                          help='доли видов, например RUN=5,WLK=3,SWM=2')
+    generate.add_argument('--duplicates', type=float, default=0.0,
+                          help='доля повторов недавних пакетов')
+    generate.add_argument('--invalid', type=float, default=0.0,
+                          help='доля некорректных пакетов')
+
+    profile = commands.add_parser(
+        'profile', help='профилировать расчет по видам тренировок')
+    profile.add_argument('input', help="файл с пакетами, '-' для stdin")
+    profile.add_argument('--input-format', default='auto',
+                         choices=('auto', 'csv', 'jsonl', 'binary'),
+                         help='auto: binary для файлов .bin, иначе текст')
+    profile.add_argument('--limit', type=int, default=100000,
+                         help='профилировать первые N пакетов')
+    profile.add_argument('--top', type=int, default=10,
+                         help='строк кода с выделениями памяти в отчете')
+    profile.add_argument('--collapsed',
+                         help='записать свернутые стеки для flamegraph')
+    profile.add_argument('--json', help='сохранить отчет в JSON')
+
+    serve = commands.add_parser('serve', help='принимать пакеты по сети')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8888)
+    serve.add_argument('--unix', help='путь к unix сокету')
+    return parser
+
+
+def cli(argv: Optional[List[str]] = None) -> None:
+    """Точка входа командной строки: python -m homework <команда>.
+    Без команды выводит сообщения для примеров пакетов.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'process' and args.workers and (
+            args.input == '-' or args.rejects or args.cache
+            or args.batch_size or args.threads or args.metrics
+            or input_format(args) == 'binary'):
+        parser.error('--workers работает только с текстовым файлом '
+                     'без --rejects, --cache, --batch-size, --threads и '
+                     '--metrics')
+    if args.command == 'process' and args.unordered and not args.workers:
+        parser.error('--unordered работает только с --workers')
+
+    if args.metrics:
+        instrumentation = enable_instrumentation()
+        try:
+            run_cli(args)
+        finally:
+            instrumentation.dump(args.metrics)
+            disable_instrumentation()
+    else:
+        run_cli(args)
+
+
+def input_format(args: 'argparse.Namespace') -> str:
+    """Определить формат входного файла."""
+    if args.input_format == 'auto':
+        return 'binary' if args.input.endswith('.bin') else 'text'
+    return args.input_format
+
+
+def run_cli(args: 'argparse.Namespace') -> None:
+    """Выполнить команду по разобранным аргументам."""
+    if args.command == 'serve':
+        import asyncio
+
+        asyncio.run(serve(args.host, args.port, args.unix))
+    elif args.command == 'process':
+        with ExitStack() as stack:
+            run_process(args, stack)
+    elif args.command == 'generate':
+        with ExitStack() as stack:
+            run_generate(args, stack)
+    elif args.command == 'profile':
+        with ExitStack() as stack:
+            run_profile(args, stack)
+    elif args.command in ('partition', 'worker', 'merge'):
+        with ExitStack() as stack:
+            run_partition_command(args, stack)
+    else:
+        for workout_type, data in SAMPLE_PACKAGES:
+            training = read_package(workout_type, data)
+            main(training)
+
+
+def read_input(
+        args: 'argparse.Namespace', stack: ExitStack,
+        chunk_size: int = CHUNK_SIZE,
+        reject: Optional[Callable[[Any, str], None]] = None
+) -> Iterator[Package]:
+    """Лениво читать пакеты из args.input, '-' — stdin, открывая файлы в
+    stack. Бинарный ввод читается порциями, файл — через mmap.
+    """
+    if input_format(args) == 'binary':
+        if args.input == '-':
+            return iter_binary_stream(sys.stdin.buffer, chunk_size)
+        return iter_binary_file(args.input)
+    src = sys.stdin if args.input == '-' else stack.enter_context(
+        open(args.input, encoding='utf-8'))
+    return iter_packages(src, chunk_size, reject)
+
+
+def run_process(args: 'argparse.Namespace', stack: ExitStack) -> None:
+    """Выполнить команду process, открывая файлы в stack."""
+    dst = sys.stdout if args.output == '-' else stack.enter_context(
+        open(args.output, 'w', encoding='utf-8'))
+    if args.workers:
+        process_file_parallel(args.input, dst, args.workers,
+                              not args.unordered,
+                              output_format=args.output_format)
+        return
+    reject = None
+    if args.rejects:
+        reject = RejectSink(stack.enter_context(
+            open(args.rejects, 'w', encoding='utf-8')))
+    packages = read_input(args, stack, args.chunk_size, reject)
+    batch_size = args.batch_size or BUFFER_SIZE
+    if args.threads:
+        if reject is not None:
+            packages = filter_valid(packages, reject)
+        run_pipeline(packages, dst, compute_threads=args.threads,
+                     buffer_size=batch_size,
+                     output_format=args.output_format,
+                     cache=(ThreadSafePackageCache(args.cache)
+                            if args.cache else None))
+        return
+    process_packages(packages, dst, batch_size, reject,
+                     PackageCache(args.cache) if args.cache else None,
+                     args.output_format)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Разобрать доли видов тренировок вида RUN=5,WLK=3."""
+    mix = {}
+    for item in text.split(','):
+        workout_type, _, share = item.partition('=')
+        mix[workout_type.strip()] = float(share)
+    return mix
+
+
+def run_generate(args: 'argparse.Namespace', stack: ExitStack) -> None:
+    """Выполнить команду generate, открывая файлы в stack."""
+    output_format = args.format
+    if output_format == 'auto':
+        output_format = 'binary' if args.output.endswith('.bin') else 'csv'
+    generator = PackageGenerator(
+        args.seed, args.mix, duplicate_ratio=args.duplicates,
+        invalid_rate=args.invalid,
+        invalid_kinds=(('duration', 'weight') if output_format == 'binary'
+                       else INVALID_KINDS))
+    packages = generator.packages(args.count)
+    if output_format == 'binary':
+        dst = sys.stdout.buffer if args.output == '-' else (
+            stack.enter_context(open(args.output, 'wb')))
+        write_binary(packages, dst)
+        return
+    dst = sys.stdout if args.output == '-' else stack.enter_context(
+        open(args.output, 'w', encoding='utf-8'))
+    write_packages(packages, dst, output_format)
+
+
+def run_profile(args: 'argparse.Namespace', stack: ExitStack) -> None:
+    """Выполнить команду profile, открывая файлы в stack."""
+    packages = read_input(args, stack)
+    collapsed = None
+    if args.collapsed:
+        collapsed = stack.enter_context(
+            open(args.collapsed, 'w', encoding='utf-8'))
+    report = profile_packages(islice(packages, args.limit), collapsed,
+                              args.top)
+    sys.stdout.write(format_profile(report))
+    if args.json:
+        write_atomic(args.json, json.dumps(report, ensure_ascii=False,
+                                           indent=2))
+
+
+def run_partition_command(args: 'argparse.Namespace',
+                          stack: ExitStack) -> None:
+    """Выполнить команды partition, worker и merge."""
+    if args.command == 'partition':
+        src = sys.stdin if args.input == '-' else stack.enter_context(
+            open(args.input, encoding='utf-8'))
+        partition_packages(iter_packages(src), args.directory, args.scheme,
+                           args.partitions)
+    elif args.command == 'worker' and args.names:
+        for name in args.names:
+            process_partition(args.directory, name, args.output_format)
+    elif args.command == 'worker':
+        errors = run_partitions(args.directory, args.workers,
+                                args.output_format)
+        for name, error in sorted(errors.items()):
+            print('Раздел %s: %s' % (name, error), file=sys.stderr)
+        if errors:
+            sys.exit(1)
+    else:
+        dst = sys.stdout if args.output == '-' else stack.enter_context(
+            open(args.output, 'w', encoding='utf-8'))
+        aggregator = merge_partitions(args.directory, dst,
+                                      args.output_format)
+        if args.aggregate:
+            write_atomic(args.aggregate, json.dumps(aggregator.to_dict()))
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,3 +1,6 @@
+import asyncio
+import io
+import json
 import pytest
 import types
 import inspect
@@ -384,3 +387,946 @@ def test_main_output(input_data, expected):
     assert get_message_output == expected, (
         'Метод `main` должен печатать результат в консоль.\n'
     )
+
+
+@pytest.mark.parametrize('workout_type, packages', [
+    ('SWM', [[720, 1, 80, 25, 40], [420, 4, 20, 42, 4],
+             [1206, 12, 6, 12, 6]]),
+    ('RUN', [[9000, 1, 75], [420, 4, 20], [1206, 12, 6]]),
+    ('WLK', [[9000, 1, 75, 180], [420, 4, 20, 42], [1206, 12, 6, 12]]),
+])
+def test_calculate_batch(workout_type, packages):
+    training_class = homework.TRAINING_CODES_AND_CLASSES[workout_type]
+    names = list(inspect.signature(training_class).parameters)
+    columns = {name: [data[i] for data in packages]
+               for i, name in enumerate(names)}
+    result = homework.calculate_batch(workout_type, columns)
+    for i, data in enumerate(packages):
+        training = homework.read_package(workout_type, data)
+        assert result['distance'][i] == training.get_distance(), (
+            'Пакетный расчет дистанции должен совпадать с расчетом объекта.'
+        )
+        assert result['speed'][i] == training.get_mean_speed(), (
+            'Пакетный расчет скорости должен совпадать с расчетом объекта.'
+        )
+        assert result['calories'][i] == training.get_spent_calories(), (
+            'Пакетный расчет калорий должен совпадать с расчетом объекта.'
+        )
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('RUN,15000,1,75', ('RUN', [15000, 1, 75])),
+    ('WLK, 9000, 1.5, 75, 180\n', ('WLK', [9000, 1.5, 75, 180])),
+    ('["SWM", [720, 1, 80, 25, 40]]', ('SWM', [720, 1, 80, 25, 40])),
+    ('{"workout_type": "RUN", "data": [15000, 1, 75]}',
+     ('RUN', [15000, 1, 75])),
+])
+def test_parse_package(line, expected):
+    assert homework.parse_package(line) == expected, (
+        'Функция `parse_package` должна разбирать CSV и JSON строки.'
+    )
+
+
+def test_process_stream():
+    src = io.StringIO(
+        'SWM,720,1,80,25,40\n\n'
+        '["RUN", [1206, 12, 6]]\n'
+        'WLK,9000,1,75,180\n'
+    )
+    dst = io.StringIO()
+    count = homework.process_stream(src, dst, chunk_size=8, buffer_size=2)
+    with Capturing() as expected:
+        for workout_type, data in [('SWM', [720, 1, 80, 25, 40]),
+                                   ('RUN', [1206, 12, 6]),
+                                   ('WLK', [9000, 1, 75, 180])]:
+            homework.main(homework.read_package(workout_type, data))
+    assert count == 3
+    assert dst.getvalue().splitlines() == expected, (
+        'Потоковая обработка должна выводить те же сообщения, что и `main`.'
+    )
+
+
+def test_process_file_parallel(tmp_path):
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6]),
+                ('WLK', [9000, 1, 75, 180])] * 20
+    path = tmp_path / 'packages.csv'
+    path.write_text(''.join(
+        '%s,%s\n' % (code, ','.join(map(str, data)))
+        for code, data in packages), encoding='utf-8')
+    shards = homework.split_shards(str(path), shard_size=100)
+    assert shards[0][0] == 0 and shards[-1][1] == path.stat().st_size
+    dst = io.StringIO()
+    homework.process_file_parallel(str(path), dst, workers=2,
+                                   shard_size=100)
+    expected = [homework.read_package(*package).show_training_info()
+                .get_message() for package in packages]
+    assert dst.getvalue().splitlines() == expected, (
+        'Параллельная обработка должна сохранять порядок пакетов.'
+    )
+
+
+def test_slots():
+    info = homework.InfoMessage('Running', 1, 9.75, 9.75, 699.75)
+    assert not hasattr(info, '__dict__'), (
+        '`InfoMessage` должен хранить поля в слотах.'
+    )
+    for training_class in (homework.Running, homework.SportsWalking,
+                           homework.Swimming):
+        assert 'action' not in vars(training_class), (
+            f'Класс `{training_class.__name__}` не должен повторять '
+            'слоты базового класса.'
+        )
+    running = homework.Running(15000, 1, 75)
+    running.COEF_CALL_1 = 0
+    assert running.get_spent_calories() == -20 * 75 / 1000 * 60, (
+        'Константы должны переопределяться у экземпляра.'
+    )
+
+
+@pytest.mark.parametrize('input_data', [
+    ['Swimming', 1, 75, 1, 80],
+    ['Running', 12.0005, -0.0001, 0.0645, -81.32032799999999],
+    ['SportsWalking', 1e20, float('inf'), float('nan'), 157.50000000000003],
+])
+def test_format_many(input_data):
+    info = homework.InfoMessage(*input_data)
+    expected = info.INFO_MESSAGE.format(**dict(zip(
+        homework.INFO_FIELDS, input_data)))
+    assert info.get_message() == expected, (
+        'Метод `get_message` должен совпадать с форматированием шаблона.'
+    )
+    assert homework.format_many([info, info]) == (
+        expected + '\n' + expected + '\n'
+    ), '`format_many` должна выводить каждое сообщение с новой строки.'
+
+
+def test_format_many_mixed_classes():
+    class ShortMessage(homework.InfoMessage):
+        __slots__ = ()
+        INFO_MESSAGE = '{training_type}: {distance:.1f} км'
+
+    messages = [homework.InfoMessage('Running', 1, 2, 3, 4),
+                ShortMessage('Swimming', 1, 2.25, 3, 4),
+                homework.InfoMessage('SportsWalking', 1, 5, 3, 4)]
+    assert homework.format_many(messages) == ''.join(
+        info.get_message() + '\n' for info in messages), (
+        '`format_many` должна использовать шаблон класса каждого сообщения.'
+    )
+    assert homework.format_many([]) == ''
+
+
+@pytest.mark.parametrize('input_data', [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [15000, 1, 75]),
+    ('WLK', [9000, 1, 75, 180]),
+])
+def test_get_metrics(input_data, monkeypatch):
+    training = homework.read_package(*input_data)
+    expected = (training.get_distance(), training.get_mean_speed(),
+                training.get_spent_calories())
+    assert training.get_metrics() == expected, (
+        'Показатели за один проход должны совпадать с методами расчета.'
+    )
+    calls = []
+    get_distance = type(training).get_distance
+    monkeypatch.setattr(type(training), 'get_distance',
+                        lambda self: calls.append(1) or get_distance(self))
+    assert training.show_training_info().distance == expected[0]
+    assert len(calls) == 1, 'Дистанция должна считаться один раз.'
+
+    training.duration = 2
+    training.COEF_CALL_1 = 0
+    assert training.get_metrics() == (
+        training.get_distance(), training.get_mean_speed(),
+        training.get_spent_calories()
+    ), 'Показатели должны учитывать новые параметры и константы.'
+    assert training.show_training_info().duration == 2
+
+
+def test_get_metrics_custom_training():
+    class Cycling(homework.Training):
+        def __init__(self, action, duration, weight, wheel_km):
+            super().__init__(action, duration, weight)
+            self.wheel = wheel_km
+
+        def get_distance(self):
+            return self.action * self.wheel
+
+        def get_mean_speed(self):
+            return self.get_distance() / self.duration
+
+        def get_spent_calories(self):
+            return self.get_mean_speed() * self.weight
+
+    assert Cycling(100, 2, 70, 0.002).show_training_info().calories == 7
+
+
+def test_get_metrics_overrides(monkeypatch):
+    running = homework.Running(15000, 1, 75)
+    running.get_spent_calories = lambda: 5.0
+    running.get_mean_speed = lambda: 4.0
+    assert running.show_training_info().calories == 5.0, (
+        'Метод, замененный у экземпляра, должен вызываться без аргументов.'
+    )
+    assert running.get_metrics()[1] == 4.0
+    monkeypatch.setattr(homework.Running, 'get_spent_calories',
+                        lambda self: 1.0)
+    assert homework.Running(15000, 1, 75).get_metrics()[2] == 1.0
+
+
+def test_cached_training():
+    running = homework.CachedTraining(homework.Running(15000, 1, 75))
+    info = running.show_training_info()
+    assert running.show_training_info() is info
+    assert info.calories == 699.75
+    running.update(COEF_CALL_1=0)
+    assert running.show_training_info().calories == -90
+    running.update(duration=2)
+    assert running.show_training_info().duration == 2
+    info = running.show_training_info()
+    running.training.action = 30000
+    assert running.show_training_info().distance == 19.5, (
+        'Кэш должен сбрасываться при изменении параметров тренировки.'
+    )
+    running.training.COEF_CALL_1 = 18
+    assert running.show_training_info() is not info
+    assert running.show_training_info() is running.show_training_info()
+
+    swimming = homework.CachedTraining(
+        homework.read_package('SWM', [720, 1, 80, 25, 40]))
+    speed = swimming.show_training_info().speed
+    swimming.training.count_pool = 80
+    assert swimming.show_training_info().speed == 2 * speed
+
+
+def test_binary_packages(tmp_path):
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6]),
+                ('WLK', [9000, 1.5, 75, 180])]
+    path = tmp_path / 'packages.bin'
+    with open(path, 'wb') as dst:
+        assert homework.write_binary(packages, dst) == 3
+    decoded = list(homework.iter_binary_file(str(path)))
+    assert decoded == packages, (
+        'Бинарный формат должен декодироваться в исходные пакеты.'
+    )
+    for (workout_type, data), (_, decoded_data) in zip(packages, decoded):
+        assert (
+            homework.read_package(workout_type, decoded_data)
+            .show_training_info().get_message()
+            == homework.read_package(workout_type, data)
+            .show_training_info().get_message()
+        )
+    columns = homework.decode_binary_columns(path.read_bytes())
+    assert columns['WLK'] == {'action': [9000], 'duration': [1.5],
+                              'weight': [75], 'height': [180]}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1 << 16])
+def test_iter_binary_stream(chunk_size):
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6]),
+                ('WLK', [9000, 1.5, 75, 180])] * 5
+    stream = io.BytesIO()
+    homework.write_binary(packages, stream)
+    data = stream.getvalue()
+    assert list(homework.iter_binary_stream(
+        io.BytesIO(data), chunk_size)) == packages, (
+        'Бинарный поток должен декодироваться порциями любого размера.'
+    )
+    with pytest.raises(ValueError):
+        list(homework.iter_binary_stream(io.BytesIO(data[:-1]), chunk_size))
+
+
+def test_server():
+    async def exchange():
+        server = await homework.start_server(port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'RUN,1206,12,6\nXXX,1,2,3\n["SWM", [720, 1, 80, 25')
+        writer.write(b', 40]]\n')
+        writer.write_eof()
+        replies = (await reader.read()).decode('utf-8').splitlines()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return replies
+
+    replies = asyncio.run(exchange())
+    assert len(replies) == 3
+    assert replies[0] == homework.read_package(
+        'RUN', [1206, 12, 6]).show_training_info().get_message()
+    assert replies[1].startswith('Ошибка'), (
+        'Сервер должен отвечать ошибкой на некорректный пакет.'
+    )
+    assert replies[2].startswith('Тип тренировки: Swimming')
+
+
+def test_server_bad_lines(monkeypatch):
+    monkeypatch.setattr(homework, 'MAX_LINE_SIZE', 100)
+
+    async def exchange(*chunks):
+        server = await homework.start_server(port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for chunk in chunks:
+            writer.write(chunk)
+            await writer.drain()
+        writer.write_eof()
+        replies = (await reader.read()).decode('utf-8').splitlines()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return replies
+
+    replies = asyncio.run(exchange(
+        b'RUN,15000,1,75\n\xff\xfe\nRUN,9000,1,75\n'))
+    assert len(replies) == 3
+    assert replies[0].startswith('Тип тренировки: Running')
+    assert replies[1].startswith('Ошибка: UnicodeDecodeError')
+    assert replies[2].startswith('Тип тренировки: Running')
+
+    for chunks in [(b'RUN,15000,1,75\n' + b'1' * 200,),
+                   (b'RUN,15000,1,75\n' + b'1' * 200 + b'\nRUN,9000,1,75\n',)]:
+        replies = asyncio.run(exchange(*chunks))
+        assert len(replies) == 2
+        assert replies[1] == 'Ошибка: строка длиннее 100 байт'
+
+
+def test_training_aggregator():
+    packages = [('RUN', [1000 * i, 1, 75]) for i in range(1, 101)]
+    packages += [('SWM', [720, 1, 80, 25, 40])] * 10
+    whole = homework.TrainingAggregator()
+    parts = [homework.TrainingAggregator(), homework.TrainingAggregator()]
+    for i, package in enumerate(packages):
+        training = homework.read_package(*package)
+        whole.add(training)
+        parts[i % 2].add(training)
+    parts[0].merge(parts[1])
+    summary = whole.summary()
+    assert parts[0].summary() == summary, (
+        'Объединение частичных агрегаций должно давать тот же результат.'
+    )
+    distances = [homework.read_package(*package).get_distance()
+                 for package in packages[:100]]
+    running = summary[('Running', None)]['distance']
+    assert running['count'] == 100
+    assert running['sum'] == pytest.approx(sum(distances))
+    assert running['min'] == min(distances)
+    assert running['max'] == max(distances)
+    assert running['p50'] == pytest.approx(distances[49], rel=0.01), (
+        'Медиана должна считаться с относительной точностью 1%.'
+    )
+    assert summary[('Swimming', None)]['calories']['mean'] == (
+        pytest.approx(336.0))
+
+
+def test_register_training():
+    @homework.register_training('CYC', '<3sIdd')
+    class Cycling(homework.Training):
+        LEN_STEP = 5.0
+
+        def get_spent_calories(self):
+            return self.get_mean_speed() * self.weight
+
+    try:
+        training = homework.read_package('CYC', [1000, 2, 70])
+        assert isinstance(training, Cycling), (
+            '`read_package` должна возвращать зарегистрированный класс.'
+        )
+        assert training.show_training_info().calories == 2.5 * 70
+        assert homework.read_package(
+            *next(homework.iter_binary_packages(
+                homework.encode_package('CYC', [1000, 2, 70])))
+        ).get_distance() == 5.0
+        with pytest.raises(ValueError):
+            homework.register_training('CYC')(Cycling)
+        with pytest.raises(TypeError):
+            homework.read_package('RUN', [15000, 1])
+    finally:
+        homework.unregister_training('CYC')
+    with pytest.raises(KeyError):
+        homework.read_package('CYC', [1000, 2, 70])
+
+
+def test_instrumentation():
+    text = 'SWM,720,1,80,25,40\nRUN,1206,12,6\nWLK,9000,1,75,180\n'
+    plain = io.StringIO()
+    homework.process_stream(io.StringIO(text), plain)
+    instrumentation = homework.enable_instrumentation()
+    try:
+        measured = io.StringIO()
+        homework.process_stream(io.StringIO(text), measured)
+        with Capturing() as output:
+            homework.main(homework.read_package('RUN', [1206, 12, 6]))
+    finally:
+        homework.disable_instrumentation()
+    assert measured.getvalue() == plain.getvalue(), (
+        'Сбор статистики не должен менять вывод.'
+    )
+    assert output == plain.getvalue().splitlines()[1:2]
+    assert instrumentation.packages[('parse', 'Swimming')] == 1
+    assert instrumentation.packages[('compute', 'Running')] == 2
+    assert instrumentation.packages[('write', 'all')] == 3
+    prometheus = instrumentation.to_prometheus()
+    assert ('homework_stage_seconds_count{stage="dispatch",'
+            'training_type="SportsWalking"} 1') in prometheus
+    assert homework.INSTRUMENTATION is None
+
+
+def test_instrumentation_labels():
+    instrumentation = homework.enable_instrumentation()
+    try:
+        homework.process_stream(
+            io.StringIO('X"Y,1,2\n["A\\\\B\\n", [1]]\nRUN,1206,12,6\n'),
+            io.StringIO(), reject=lambda package, reason: None)
+    finally:
+        homework.disable_instrumentation()
+    assert instrumentation.packages[('parse', 'unknown')] == 2, (
+        'Незарегистрированные коды должны учитываться как unknown.'
+    )
+    instrumentation.observe('parse', 'a\\b"c\nd', 1e-6)
+    prometheus = instrumentation.to_prometheus()
+    assert 'training_type="a\\\\b\\"c\\nd"' in prometheus, (
+        'Значения меток должны экранироваться.'
+    )
+    assert all(line.startswith(('#', 'homework_'))
+               for line in prometheus.splitlines())
+
+
+def test_instrumentation_cache_and_rejects():
+    text = 'RUN,1206,12,6\nbroken\nRUN,1206,12,6\nWLK,9000,1,75,180\n'
+    instrumentation = homework.enable_instrumentation()
+    try:
+        homework.process_stream(io.StringIO(text), io.StringIO(),
+                                reject=lambda package, reason: None,
+                                cache=homework.PackageCache())
+    finally:
+        homework.disable_instrumentation()
+    assert instrumentation.packages[('parse', 'Running')] == 2, (
+        'Разбор с reject должен учитываться в стадии parse.'
+    )
+    assert instrumentation.packages[('dispatch', 'Running')] == 1
+    assert instrumentation.packages[('compute', 'SportsWalking')] == 1
+    assert instrumentation.packages[('cache', 'Running')] == 1, (
+        'Попадания в кэш должны учитываться в стадии cache.'
+    )
+
+
+@pytest.mark.parametrize('package, reason', [
+    (('RUN', [15000, 1, 75]), None),
+    (('SWM', [720, 1, 80, 25, 40]), None),
+    (('RUN', [15000, 1]), 'ожидается от 3 до 3 значений'),
+    (('RUN', [15000, 0, 75]), 'duration: должно быть > 0'),
+    (('WLK', [9000, 1, 75, 0]), 'height: должно быть > 0'),
+    (('SWM', [720, 1, 80, 25, '40']), 'count_pool: не число'),
+    (('WLK', [1e200, 1, 75, 180]), 'action: должно быть <= 100000000.0'),
+    (('RUN', [10 ** 400, 1, 75]), 'action: должно быть <= 100000000.0'),
+    (('RUN', [15000, float('inf'), 75]), 'duration: должно быть <= 10000.0'),
+    (('RUN', [15000, 1e-300, 75]), 'duration: должно быть >= 1e-06'),
+    (('SWM', [720, 1, 80, 25, float('nan')]),
+     'count_pool: должно быть >= 0'),
+    (('XXX', [1, 2, 3]), 'неизвестный вид тренировки'),
+])
+def test_validate_package(package, reason):
+    assert homework.validate_package(*package) == reason, (
+        'Функция `validate_package` должна возвращать причину отказа.'
+    )
+
+
+def test_process_stream_rejects_overflow():
+    src = io.StringIO('RUN,15000,1,75\nWLK,1e200,1,75,180\n'
+                      'RUN,%d,1,75\nRUN,15000,1e-300,75\n' % 10 ** 400)
+    dst = io.StringIO()
+    sink = homework.RejectSink()
+    assert homework.process_stream(src, dst, reject=sink) == 1, (
+        'Пакет, переполняющий расчет, должен отклоняться, а не прерывать '
+        'обработку.'
+    )
+    assert sink.total == 3
+
+
+def test_process_stream_rejects():
+    src = io.StringIO(
+        'RUN,1206,12,6\n'
+        'RUN,1206,0,6\n'
+        'not a package\n'
+        '{"foo": 1}\n'
+        'WLK,9000,1,75\n'
+        'SWM,720,1,80,25,40\n'
+    )
+    dst = io.StringIO()
+    rejects = io.StringIO()
+    sink = homework.RejectSink(rejects)
+    assert homework.process_stream(src, dst, reject=sink) == 2
+    assert dst.getvalue().splitlines()[1].startswith(
+        'Тип тренировки: Swimming'), (
+        'Верные пакеты должны обрабатываться после отклоненных.'
+    )
+    assert sink.total == 4
+    assert sink.counts['duration: должно быть > 0'] == 1
+    assert sink.counts['не удалось разобрать: ValueError'] == 1
+    assert len(rejects.getvalue().splitlines()) == 4
+
+
+@pytest.mark.parametrize('cache_class', ['PackageCache',
+                                         'ThreadSafePackageCache'])
+def test_package_cache(cache_class):
+    cache = getattr(homework, cache_class)(capacity=2)
+    run = ('RUN', [15000, 1, 75])
+    swim = ('SWM', [720, 1, 80, 25, 40])
+    walk = ('WLK', [9000, 1, 75, 180])
+    info = cache.get_info(*run)
+    assert info.get_message() == homework.read_package(
+        *run).show_training_info().get_message()
+    assert cache.get_info('RUN', (15000, 1, 75)) is info, (
+        'Повторный пакет должен браться из кэша.'
+    )
+    cache.get_info(*swim)
+    cache.get_info(*run)
+    cache.get_info(*walk)
+    assert cache.stats() == {'size': 2, 'hits': 2, 'misses': 3,
+                             'evictions': 1}
+    assert cache.key(*swim) not in cache.entries, (
+        'Вытесняться должен давно не использованный пакет.'
+    )
+
+
+def test_package_cache_number_types():
+    text = 'RUN,15000,1.0,75\nRUN,15000,1,75\nRUN,15000,1,75\n'
+    plain = io.StringIO()
+    homework.process_stream(io.StringIO(text), plain, output_format='csv')
+    cache = homework.PackageCache()
+    cached = io.StringIO()
+    homework.process_stream(io.StringIO(text), cached, cache=cache,
+                            output_format='csv')
+    assert cached.getvalue() == plain.getvalue(), (
+        'Пакеты с 1 и 1.0 должны кэшироваться отдельно.'
+    )
+    assert cache.stats()['misses'] == 2
+
+
+def test_run_pipeline():
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6]),
+                ('WLK', [9000, 1, 75, 180])] * 50
+    dst = io.StringIO()
+    count = homework.ThreadPipeline(
+        dispatch_threads=2, compute_threads=3, queue_size=4,
+        buffer_size=7).run(iter(packages), dst)
+    expected = [homework.read_package(*package).show_training_info()
+                .get_message() for package in packages]
+    assert count == len(packages)
+    assert dst.getvalue().splitlines() == expected, (
+        'Конвейер должен выводить сообщения в порядке пакетов.'
+    )
+    with pytest.raises(ZeroDivisionError):
+        homework.run_pipeline(
+            packages + [('RUN', [1206, 0, 6])] + packages, io.StringIO(),
+            compute_threads=2, queue_size=2)
+
+
+def test_run_pipeline_instrumentation():
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6]),
+                ('WLK', [9000, 1, 75, 180])] * 20
+    instrumentation = homework.enable_instrumentation()
+    try:
+        count = homework.run_pipeline(packages, io.StringIO(),
+                                      dispatch_threads=2, compute_threads=3)
+    finally:
+        homework.disable_instrumentation()
+    assert count == len(packages)
+    for training_type in ('Swimming', 'Running', 'SportsWalking'):
+        assert instrumentation.packages[('dispatch', training_type)] == 20
+        assert instrumentation.packages[('compute', training_type)] == 20, (
+            'Потоки конвейера должны замерять стадии dispatch и compute.'
+        )
+    assert instrumentation.packages[('format', 'all')] == len(packages)
+    assert instrumentation.packages[('write', 'all')] == len(packages)
+
+
+@pytest.mark.parametrize('options', [
+    [], ['--threads', '2'], ['--workers', '2'],
+    ['--cache', '2', '--batch-size', '1'],
+    ['--threads', '2', '--cache', '2', '--batch-size', '1'],
+])
+def test_cli_process(tmp_path, options):
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6]),
+                ('WLK', [9000, 1, 75, 180])]
+    messages = [homework.read_package(*package).show_training_info()
+                for package in packages]
+    src = tmp_path / 'packages.csv'
+    src.write_text(''.join('%s,%s\n' % (code, ','.join(map(str, data)))
+                           for code, data in packages), encoding='utf-8')
+
+    homework.cli(['process', str(src), str(tmp_path / 'out.txt')] + options)
+    assert (tmp_path / 'out.txt').read_text(encoding='utf-8') == (
+        homework.format_many(messages)
+    ), 'Команда `process` должна выводить сообщения о тренировках.'
+
+    homework.cli(['process', str(src), str(tmp_path / 'out.csv'),
+                  '--output-format', 'csv'] + options)
+    rows = (tmp_path / 'out.csv').read_text(encoding='utf-8').splitlines()
+    assert rows[0] == 'training_type,duration,distance,speed,calories'
+    assert rows[2] == 'Running,12,%r,%r,%r' % (
+        messages[1].distance, messages[1].speed, messages[1].calories)
+
+
+@pytest.mark.parametrize('options', [
+    ['process', '{src}', '--workers', '2', '--cache', '2'],
+    ['process', '{src}', '--workers', '2', '--rejects', 'r'],
+    ['process', '{src}', '--workers', '2', '--batch-size', '1'],
+    ['process', '{src}', '--workers', '2', '--threads', '2'],
+    ['--metrics', 'm.json', 'process', '{src}', '--workers', '2'],
+    ['process', '{src}', '--unordered'],
+    ['process', '{src}', '--unordered', '--threads', '2'],
+])
+def test_cli_process_workers_options(tmp_path, capsys, options):
+    src = tmp_path / 'packages.csv'
+    src.write_text('RUN,15000,1,75\n', encoding='utf-8')
+    with pytest.raises(SystemExit):
+        homework.cli([option.format(src=src) for option in options])
+    assert '--workers' in capsys.readouterr().err, (
+        'Параметры, которые --workers не поддерживает, должны отклоняться.'
+    )
+
+
+def test_run_pipeline_cache():
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6])] * 30
+    cache = homework.ThreadSafePackageCache()
+    dst = io.StringIO()
+    count = homework.run_pipeline(packages, dst, compute_threads=3,
+                                  buffer_size=5, cache=cache)
+    plain = io.StringIO()
+    homework.process_packages(packages, plain)
+    assert count == len(packages)
+    assert dst.getvalue() == plain.getvalue()
+    assert cache.stats()['hits'] + cache.stats()['misses'] == len(packages)
+    assert cache.stats()['size'] == 2, (
+        'Конвейер с cache должен брать повторы из кэша.'
+    )
+
+
+def test_cli_process_binary_columnar(tmp_path):
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6])]
+    src = tmp_path / 'packages.bin'
+    with open(src, 'wb') as dst:
+        homework.write_binary(packages, dst)
+    out = tmp_path / 'out.jsonl'
+    homework.cli(['process', str(src), str(out),
+                  '--output-format', 'columnar', '--batch-size', '1'])
+    groups = [json.loads(line) for line in
+              out.read_text(encoding='utf-8').splitlines()]
+    assert [group['training_type'] for group in groups] == [
+        ['Swimming'], ['Running']], (
+        'Колоночный вывод должен содержать группу строк на каждую пачку.'
+    )
+    assert groups[0]['calories'] == [336.0]
+
+
+def test_structured_output():
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [1206, 12, 6]),
+                ('WLK', [9000, 1, 75, 180])]
+    messages = [homework.read_package(*package).show_training_info()
+                for package in packages]
+    records = list(homework.iter_records(packages))
+    assert list(homework.InfoRecord._fields) == list(homework.INFO_FIELDS)
+    for record, info in zip(records, messages):
+        assert tuple(record) == homework.get_info_fields(info), (
+            'Запись должна содержать те же поля, что и `InfoMessage`.'
+        )
+    for size in (0, 2, 10):
+        columns = homework.collect_columns(packages, size)
+        assert len(columns) == 3
+        assert list(columns) == records, (
+            'Колонки должны содержать те же значения, что и записи.'
+        )
+        assert list(columns.columns()['calories']) == [
+            info.calories for info in messages]
+
+
+def test_workout_store(tmp_path):
+    packages = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [15000, 1, 75]),
+        ('WLK', [9000, 1, 75, 180]),
+        ('RUN', [5000, 2, 60]),
+    ]
+    path = str(tmp_path / 'store')
+    with homework.WorkoutStore(path, buffer_rows=3, block_rows=1) as store:
+        assert store.extend(packages) == 4
+    store = homework.WorkoutStore(path)
+    assert len(store) == 4
+    records = [homework.read_package(*package).show_training_record()
+               for package in packages]
+    assert list(store.query('RUN')) == [1, 3]
+    assert list(store.select(calories=(None, 500))) == [
+        record for record in records if record.calories <= 500]
+    assert list(store.query('RUN', distance=(5, None))) == [1]
+    assert list(store.query('RUN', height=(None, None))) == []
+    assert list(store.query('XXX')) == []
+    assert store.package(2) == ('WLK', [9000, 1, 75, 180])
+    assert store.record(0) == records[0]
+
+
+def test_recalculate_batch(monkeypatch, tmp_path):
+    monkeypatch.setattr(homework, 'COEFFICIENTS', {})
+    homework.register_coefficients('v2', {'RUN': {'COEF_CALL_1': 19},
+                                          'SWM': {'LEN_STEP': 1.5}})
+    with pytest.raises(ValueError):
+        homework.register_coefficients('v2', {})
+    with pytest.raises(ValueError):
+        homework.register_coefficients('v3', {'RUN': {'HEIGHT': 1}})
+    assert homework.get_coefficients('RUN', 'v2')['COEF_CALL_1'] == 19
+    assert homework.get_coefficients('RUN')['COEF_CALL_1'] == 18
+    running = homework.versioned_class(homework.Running, 'RUN', 'v2')
+    assert running.__name__ == 'Running'
+    assert homework.versioned_class(homework.Running, 'RUN', None) is (
+        homework.Running)
+
+    columns = {'action': [9000], 'duration': [1], 'weight': [75]}
+    stored = {'distance': ['D'], 'speed': [5.85], 'calories': ['C']}
+    result = homework.recalculate_batch('RUN', columns, stored, None, 'v2')
+    assert result['distance'] == ['D']
+    assert result['calories'] == running.calculate_batch(columns)['calories']
+    assert homework.recalculate_batch(
+        'WLK', columns, stored, None, 'v2') == stored
+
+    packages = [('SWM', [720, 1, 80, 25, 40]), ('RUN', [15000, 1, 75]),
+                ('WLK', [9000, 1, 75, 180])]
+    store = homework.WorkoutStore(str(tmp_path / 'v1'))
+    store.extend(packages)
+    updated = store.recalculate(str(tmp_path / 'v2'), None, 'v2')
+    assert [updated.record(row) for row in range(3)] == [
+        homework.versioned_class(
+            homework.TRAINING_CODES_AND_CLASSES[workout_type],
+            workout_type, 'v2')(*data).show_training_record()
+        for workout_type, data in packages]
+    with pytest.raises(ValueError):
+        store.recalculate(str(tmp_path / 'v2'))
+
+
+def test_partitions(tmp_path):
+    packages = [(workout_type, data)
+                for _ in range(10) for workout_type, data in [
+                    ('SWM', [720, 1, 80, 25, 40]),
+                    ('RUN', [15000, 1, 75]),
+                    ('WLK', [9000, 1, 75, 180])]]
+    packages = [(workout_type, [data[0] + number] + data[1:])
+                for number, (workout_type, data) in enumerate(packages)]
+    broken = list(packages)
+    broken[7] = ('RUN', [15007, 0, 75])
+    path = str(tmp_path / 'parts')
+    names = homework.partition_packages(broken, path, 'hash', 4)
+    assert names == sorted(names)
+    with pytest.raises(ValueError):
+        homework.partition_packages(broken, path)
+
+    errors = homework.run_partitions(path, workers=2, output_format='csv')
+    assert list(errors) == homework.pending_partitions(path, 'csv')
+    with pytest.raises(RuntimeError):
+        homework.merge_partitions(path, io.StringIO(), 'csv')
+
+    failed, = errors
+    source = homework.partition_file(path, 'part', failed)
+    with open(source) as src:
+        lines = src.read().replace('[15007, 0, 75]', '[15007, 1, 75]')
+    with open(source, 'w') as dst:
+        dst.write(lines)
+    assert homework.run_partitions(path, output_format='csv') == {}
+    assert homework.pending_partitions(path, 'csv') == []
+
+    dst = io.StringIO()
+    aggregator = homework.merge_partitions(path, dst, 'csv')
+    expected = io.StringIO()
+    homework.process_packages(packages, expected, output_format='csv')
+    assert dst.getvalue() == expected.getvalue()
+    summary = aggregator.summary()
+    assert sorted(summary) == [('Running', None), ('SportsWalking', None),
+                               ('Swimming', None)]
+    assert summary['Running', None]['calories']['count'] == 10
+
+    restored = homework.TrainingAggregator.from_dict(
+        json.loads(json.dumps(aggregator.to_dict())))
+    assert restored.summary() == summary
+
+
+def test_cli_partitions(tmp_path, capsys):
+    source = tmp_path / 'packages.csv'
+    source.write_text('SWM,720,1,80,25,40\nRUN,15000,1,75\nWLK,9000,1,75,180\n'
+                      'RUN,5000,2,60\n')
+    path = str(tmp_path / 'parts')
+    homework.cli(['partition', str(source), path, '--scheme', 'type'])
+    assert homework.pending_partitions(path) == ['RUN', 'SWM', 'WLK']
+    homework.cli(['worker', path, 'RUN'])
+    assert homework.pending_partitions(path) == ['SWM', 'WLK']
+    homework.cli(['worker', path, '--workers', '2'])
+    aggregate = str(tmp_path / 'aggregate.json')
+    homework.cli(['merge', path, '--aggregate', aggregate])
+    expected = io.StringIO()
+    homework.process_stream(io.StringIO(source.read_text()), expected)
+    assert capsys.readouterr().out == expected.getvalue()
+    with open(aggregate) as src:
+        assert homework.TrainingAggregator.from_dict(
+            json.load(src)).summary()['Running', None]['distance'][
+                'count'] == 2
+
+
+@pytest.mark.parametrize('workout_type, data', [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('SWM', [1206, 1.2, 85, 50, 11]),
+    ('RUN', [15000, 1, 75]),
+    ('RUN', [4321, 0.7, 63.5]),
+    ('WLK', [9000, 1, 75, 180]),
+    ('WLK', [12345, 1.9, 58.2, 163]),
+])
+def test_kernel_parity(workout_type, data):
+    training_class = homework.TRAINING_CODES_AND_CLASSES[workout_type]
+    training = training_class(*data)
+    assert homework.get_kernel(training_class)(*data) == (
+        training.get_distance(), training.get_mean_speed(),
+        training.get_spent_calories())
+    assert list(homework.iter_records([(workout_type, data)], True)) == [
+        training.show_training_record()]
+
+
+def test_kernel_fallback(monkeypatch):
+    class Custom(homework.Running):
+        def get_spent_calories(self):
+            return 1.0
+
+    assert homework.get_kernel(Custom)(15000, 1, 75)[2] == 1.0
+
+    class Wrong(homework.Running):
+        @homework.formula('speed * weight')
+        def get_spent_calories(self, speed=None):
+            return 2.0
+
+    assert homework.get_kernel(Wrong)(15000, 1, 75)[2] == 2.0
+
+    class WrongWalking(homework.SportsWalking):
+        @homework.formula(
+            homework.SportsWalking.get_spent_calories.formula.replace(
+                'COEF_CALL_2', '99'))
+        def get_spent_calories(self, speed=None):
+            return super().get_spent_calories(speed)
+
+    assert homework.get_kernel(WrongWalking)(30000, 0.5, 75, 100) == (
+        WrongWalking(30000, 0.5, 75, 100).get_metrics()), (
+        'Проверка ядра должна проходить ветвь speed ** 2 >= height.'
+    )
+    monkeypatch.setattr(homework.Running, 'get_spent_calories',
+                        lambda self: 1.0)
+    assert homework.get_kernel(homework.Running)(15000, 1, 75)[2] == 1.0
+    monkeypatch.undo()
+    assert homework.get_kernel(homework.Running)(15000, 1, 75)[2] == 699.75
+    monkeypatch.setattr(homework.Running, 'COEF_CALL_1', 20)
+    assert homework.get_kernel(homework.Running)(15000, 1, 75) == (
+        homework.Running(15000, 1, 75).get_metrics())
+    with pytest.raises(KeyError):
+        list(homework.iter_records([('XXX', [1, 1, 1])], True))
+    columns = homework.collect_columns(homework.SAMPLE_PACKAGES, kernels=True)
+    assert list(columns) == list(homework.iter_records(
+        homework.SAMPLE_PACKAGES))
+
+
+def test_training_session():
+    session = homework.TrainingSession('RUN', 0, split_km=1, weight=75)
+    splits = list(homework.iter_splits(
+        session, ((second, 20) for second in range(10, 3601, 10))))
+    assert [round(info.distance) for info in splits] == [1, 1, 1, 1, 1]
+    assert sum(info.duration for info in splits) == pytest.approx(1)
+    assert session.show_training_info() == homework.read_package(
+        'RUN', [7200, 1, 75]).show_training_info()
+    assert session.totals == {'action': 7200}
+    with pytest.raises(ValueError):
+        session.add(0, 10)
+
+    session = homework.TrainingSession(
+        'SWM', 0, split_seconds=900, weight=80, length_pool=25)
+    splits = list(homework.iter_splits(session, [
+        (second, 30, second % 60 == 0) for second in range(10, 3601, 10)]))
+    assert len(splits) == 4
+    assert splits[0] == homework.read_package(
+        'SWM', [2700, 0.25, 80, 25, 15]).show_training_info()
+    assert session.finish() is None
+
+
+def test_training_session_idle():
+    session = homework.TrainingSession('WLK', 100, split_seconds=600,
+                                       weight=75, height=180)
+    assert session.show_training_info() == homework.InfoMessage(
+        'SportsWalking', 0.0, 0.0, 0.0, 0.0), (
+        'Сессия без прошедшего времени не должна делить на ноль.'
+    )
+    assert session.add(100, 50) is None
+    assert session.show_training_info().distance == pytest.approx(0.0325)
+    splits = list(homework.iter_splits(session, [
+        (second, 20 if second <= 700 else 0)
+        for second in range(110, 1001, 10)]))
+    assert [info.duration * 3600 for info in splits] == pytest.approx(
+        [600, 300]), 'Отрезок отдыха в конце не должен теряться.'
+    assert splits[1].distance == pytest.approx(0)
+
+
+def test_package_generator():
+    packages = list(homework.PackageGenerator(7).packages(3000))
+    assert packages == list(homework.PackageGenerator(7).packages(3000))
+    assert packages != list(homework.PackageGenerator(8).packages(3000))
+    assert all(homework.validate_package(*package) is None
+               for package in packages)
+    shares = {code: sum(package[0] == code for package in packages) / 3000
+              for code in homework.GENERATOR_MIX}
+    assert shares == pytest.approx(homework.GENERATOR_MIX, abs=0.05)
+
+    generator = homework.PackageGenerator(
+        1, mix={'RUN': 1}, duplicate_ratio=0.5, invalid_rate=0.2, window=10)
+    packages = list(generator.packages(2000))
+    assert len(generator.recent) == 10
+    assert {package[0] for package in packages} <= {'RUN', 'XXX'}
+    invalid = sum(homework.validate_package(*package) is not None
+                  for package in packages)
+    assert 0.1 < invalid / 2000 < 0.3
+    assert len(set(map(repr, packages))) < 1500
+
+
+@pytest.mark.parametrize('name, output_format', [
+    ('packages.csv', 'csv'), ('packages.jsonl', 'jsonl'),
+    ('packages.bin', 'binary')])
+def test_cli_generate(tmp_path, name, output_format):
+    path = str(tmp_path / name)
+    homework.cli(['generate', path, '--count', '50', '--seed', '3',
+                  '--mix', 'RUN=1,SWM=1', '--invalid', '0.1'])
+    expected = list(homework.PackageGenerator(
+        3, {'RUN': 1, 'SWM': 1}, invalid_rate=0.1,
+        invalid_kinds=(('duration', 'weight') if output_format == 'binary'
+                       else homework.INVALID_KINDS)).packages(50))
+    if output_format == 'binary':
+        packages = list(homework.iter_binary_file(path))
+    else:
+        with open(path) as src:
+            packages = list(homework.iter_packages(src))
+    assert packages == expected
+
+
+def test_profile_packages(tmp_path, capsys):
+    packages = homework.SAMPLE_PACKAGES * 20
+    collapsed = io.StringIO()
+    report = homework.profile_packages(packages, collapsed, top=3)
+    assert list(report) == ['Running', 'SportsWalking', 'Swimming']
+    running = report['Running']
+    assert running['packages'] == 20
+    assert running['methods']['get_spent_calories']['calls'] == 20
+    assert running['methods']['get_message']['calls'] == 20
+    assert set(running['methods']) <= set(homework.PROFILE_METHODS)
+    assert running['allocations']['blocks'] >= 20
+    assert len(running['allocations']['lines']) <= 3
+    stacks = collapsed.getvalue().splitlines()
+    assert any(line.startswith('Swimming;') and 'Swimming.get_mean_speed'
+               in line for line in stacks)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in stacks)
+
+    source = tmp_path / 'packages.csv'
+    source.write_text('RUN,15000,1,75\nWLK,9000,1,75,180\n')
+    path = str(tmp_path / 'report.json')
+    homework.cli(['profile', str(source), '--json', path])
+    assert 'get_spent_calories' in capsys.readouterr().out
+    with open(path) as src:
+        assert set(json.load(src)) == {'Running', 'SportsWalking'}